@@ -0,0 +1,59 @@
+"""
+Hooks around the scheduler's calls into apps.
+
+The scheduler drives every app by calling its update() and draw() methods.
+Emulator tooling registers wrappers here and install() patches the
+scheduler so that each app passed to start_app() has its methods wrapped.
+Wrappers that only apply to one scheduler, like those that need to know
+which badge's display the app draws on, can be passed to install().
+
+The apps that are running are kept in running, along with the scheduler
+and arguments they were started with, so that they can be restarted.
+"""
+
+APP_METHODS = ("update", "draw", "background_update")
+
+wrappers = []
+# (scheduler, app, args, kwargs) for each app that has been started
+running = []
+
+
+def add_wrapper(wrapper):
+    # wrapper(app, name, method) must return a callable with the same
+    # signature as method
+    wrappers.append(wrapper)
+
+
+def wrap_app(app, extra=()):
+    if getattr(app, "_emulator_wrapped", False):
+        return app
+    for name in APP_METHODS:
+        method = getattr(app, name, None)
+        if method is None:
+            continue
+        for wrapper in wrappers + list(extra):
+            method = wrapper(app, name, method)
+        setattr(app, name, method)
+    app._emulator_wrapped = True
+    return app
+
+
+def install(scheduler, extra=()):
+    real_start_app = scheduler.start_app
+
+    def start_app(app, *args, **kwargs):
+        wrap_app(app, extra)
+        running.append((scheduler, app, args, kwargs))
+        return real_start_app(app, *args, **kwargs)
+
+    scheduler.start_app = start_app
+
+    real_stop_app = getattr(scheduler, "stop_app", None)
+    if real_stop_app is None:
+        return
+
+    def stop_app(app, *args, **kwargs):
+        running[:] = [entry for entry in running if entry[1] is not app]
+        return real_stop_app(app, *args, **kwargs)
+
+    scheduler.stop_app = stop_app
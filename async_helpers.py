@@ -1,6 +1,8 @@
 import asyncio
 import sys
 
+import log
+
 if hasattr(sys.implementation, "_machine"):  # MicroPython
     from threadsafe import Message
 else:
@@ -27,26 +29,26 @@ else:
 # Thanks to https://github.com/peterhinch/micropython-async/blob/master/v3/docs/THREADING.md
 async def unblock(func, periodic_func, *args, **kwargs):
     def wrap(func, message, args, kwargs):
-        print("In thread")
+        log.debug("unblock", "In thread")
         try:
-            print(func, args, kwargs)
+            log.debug("unblock", func, args, kwargs)
             result = func(*args, **kwargs)
         except Exception as e:
             result = e
-        print(result)
+        log.debug("unblock", result)
         message.set(result)  # Run the blocking function.
 
     # msg = Message()
-    print("Starting thread")
+    log.debug("unblock", "Starting thread")
     # _thread.start_new_thread(print, ("Test", ))
     # tid = _thread.start_new_thread(wrap, (func, msg, args, kwargs))
     # print(tid)
     # time.sleep(1)
     result = func(*args, **kwargs)
-    print("async unblock")
+    log.debug("unblock", "async unblock")
     await periodic_func()
     # result = await msg.wait()
-    print(result)
+    log.debug("unblock", result)
     if isinstance(result, Exception):
         raise result
     else:
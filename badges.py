@@ -0,0 +1,268 @@
+"""
+Several badges running in one interpreter.
+
+Each Badge gets its own copy of every firmware module, so the display,
+LEDs, settings, eventbus, scheduler and apps of one badge are separate from
+those of every other badge. The modules are executed from code objects that
+are compiled once and shared between all badges.
+
+Isolation works through each badge having its own builtins: its __import__
+resolves firmware modules from the badge's module table rather than
+sys.modules, and its open(), os and os.path map the paths the firmware
+writes to (installed apps, backgrounds and settings) into a directory of
+the badge's own. Anything that is not firmware, like the standard library or
+requests, is imported as usual and shared, except for the standard library
+modules in BADGE_STDLIB. Those write files, so each badge runs its own copy
+with the badge's builtins.
+"""
+import builtins
+import importlib.util
+import os
+import sys
+import types
+
+import app_hooks
+import persist
+
+# Paths owned by a badge, relative to the root of its filesystem
+PRIVATE_PATHS = ("/apps", "/backgrounds", "/settings.json")
+
+BADGES_ROOT = persist.ROOT + "/badges"
+
+# Emulator modules that all badges share, rather than having a copy each
+SHARED_MODULES = {"log"}
+
+# Standard library modules that write files, which each badge gets a copy of
+BADGE_STDLIB = {"shutil", "tarfile"}
+
+# Functions of os and os.path whose path arguments are mapped for a badge
+OS_PATH_FUNCTIONS = {
+    "access", "chdir", "chmod", "listdir", "lstat", "makedirs", "mkdir",
+    "open", "remove", "removedirs", "rename", "renames", "replace", "rmdir",
+    "scandir", "stat", "statvfs", "symlink", "truncate", "unlink", "utime",
+    "walk",
+}
+OS_PATH_QUERIES = {
+    "exists", "getatime", "getctime", "getmtime", "getsize", "isdir",
+    "isfile", "islink", "lexists", "samefile",
+}
+
+
+class CodeCache:
+    # Compiled firmware, shared by all badges
+
+    def __init__(self, code=None):
+        self.code = dict(code or {})
+
+    def get(self, path):
+        code = self.code.get(path)
+        if code is None:
+            with open(path) as f:
+                code = compile(f.read(), path, "exec")
+            self.code[path] = code
+        return code
+
+    def forget(self, path):
+        self.code.pop(path, None)
+
+
+class _BadgePaths(types.ModuleType):
+    # A module that passes everything through to module, mapping the path
+    # arguments of the functions in mapped for a badge
+
+    def __init__(self, name, badge, module, mapped):
+        super().__init__(name)
+        self._badge = badge
+        self._module = module
+        self._mapped = mapped
+
+    def __getattr__(self, name):
+        value = getattr(self._module, name)
+        if name in self._mapped:
+            value = self._map_paths(value)
+        # Look it up only once
+        setattr(self, name, value)
+        return value
+
+    def _map_paths(self, function):
+        path = self._badge.path
+
+        def mapped(*args, **kwargs):
+            return function(*(path(arg) for arg in args), **kwargs)
+
+        mapped.__name__ = function.__name__
+        return mapped
+
+
+class _BadgeOS(_BadgePaths):
+    # The os module as seen by a badge
+
+    def __init__(self, badge):
+        super().__init__("os", badge, os, OS_PATH_FUNCTIONS)
+        self.path = _BadgePaths("os.path", badge, os.path, OS_PATH_QUERIES)
+
+
+class Badge:
+    def __init__(self, index, fakes, code_cache, firmware_root=None):
+        self.index = index
+        self.firmware_root = firmware_root or os.getcwd()
+        self.fs_root = f"{BADGES_ROOT}/{index}"
+        self.modules = dict(fakes)
+        # Module name -> names of the firmware modules that imported it
+        self.imported_by = {}
+        self._code_cache = code_cache
+
+        for private in PRIVATE_PATHS:
+            if "." not in private:
+                os.makedirs(self.fs_root + private, exist_ok=True)
+
+        self.builtins = dict(builtins.__dict__)
+        self.builtins["__import__"] = self._import
+        self.builtins["open"] = self._open
+        self._os = _BadgeOS(self)
+        # For modules that use builtins.open, like tarfile
+        self._builtins_module = types.ModuleType("builtins")
+        self._builtins_module.__dict__.update(self.builtins)
+
+    def __repr__(self):
+        return f"<Badge {self.index}>"
+
+    def path(self, path):
+        if isinstance(path, os.PathLike):
+            path = os.fspath(path)
+        if isinstance(path, str):
+            absolute = path if path.startswith("/") else "/" + path
+            for private in PRIVATE_PATHS:
+                if absolute == private or absolute.startswith(private + "/"):
+                    return self.fs_root + absolute
+        return path
+
+    def _open(self, file, *args, **kwargs):
+        return builtins.open(self.path(file), *args, **kwargs)
+
+    @staticmethod
+    def _find(name, search):
+        # Returns (source file, package path), either of which may be None,
+        # or None if name isn't found in the search directories
+        namespace = []
+        for directory in search:
+            package = f"{directory}/{name}"
+            if os.path.isfile(package + "/__init__.py"):
+                return package + "/__init__.py", [package]
+            if os.path.isfile(package + ".py"):
+                return package + ".py", None
+            if os.path.isdir(package):
+                namespace.append(package)
+        return (None, namespace) if namespace else None
+
+    def _is_firmware(self, name):
+        top = name.partition(".")[0]
+        if top in self.modules:
+            return True
+        if top in SHARED_MODULES:
+            return False
+        return self._find(top, [self.fs_root, self.firmware_root]) is not None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            package = (globals or {}).get("__package__") or ""
+            name = importlib.util.resolve_name("." * level + name, package)
+        if name == "os" or (name == "os.path" and not fromlist):
+            return self._os
+        if name == "os.path":
+            return self._os.path
+        if name == "builtins":
+            return self._builtins_module
+        if name in BADGE_STDLIB:
+            return self._import_stdlib(name)
+        if not self._is_firmware(name):
+            return builtins.__import__(name, globals, locals, fromlist, 0)
+
+        importer = (globals or {}).get("__name__")
+        if importer:
+            self._record_import(importer, name, fromlist)
+        module = self.import_module(name)
+        if not fromlist:
+            return self.modules[name.partition(".")[0]]
+        if hasattr(module, "__path__"):
+            for item in fromlist:
+                if item != "*" and not hasattr(module, item):
+                    try:
+                        self.import_module(f"{name}.{item}")
+                    except ModuleNotFoundError:
+                        pass
+        return module
+
+    def _import_stdlib(self, name):
+        module = self.modules.get(name)
+        if module is not None:
+            return module
+        builtins.__import__(name)  # For its dependencies
+        source = sys.modules[name].__file__
+        module = types.ModuleType(name)
+        module.__builtins__ = self.builtins
+        module.__file__ = source
+        self.modules[name] = module
+        try:
+            exec(self._code_cache.get(source), module.__dict__)
+        except BaseException:
+            del self.modules[name]
+            raise
+        return module
+
+    def _record_import(self, importer, name, fromlist):
+        # For hot reloading, see hot_reload.dependents()
+        self.imported_by.setdefault(name, set()).add(importer)
+        for item in fromlist or ():
+            if item != "*":
+                self.imported_by.setdefault(f"{name}.{item}", set()).add(importer)
+
+    def import_module(self, fullname):
+        module = self.modules.get(fullname)
+        if module is not None:
+            return module
+
+        parent_name, _, child = fullname.rpartition(".")
+        if parent_name:
+            parent = self.import_module(parent_name)
+            search = getattr(parent, "__path__", None)
+        else:
+            parent = None
+            search = [self.fs_root, self.firmware_root]
+        found = self._find(child, search) if search else None
+        if found is None:
+            raise ModuleNotFoundError(f"No module named {fullname!r}", name=fullname)
+        source, path = found
+
+        module = types.ModuleType(fullname)
+        module.__builtins__ = self.builtins
+        if path is not None:
+            module.__path__ = path
+            module.__package__ = fullname
+        else:
+            module.__package__ = parent_name
+
+        self.modules[fullname] = module
+        if source is not None:  # Not a namespace package
+            module.__file__ = source
+            try:
+                exec(self._code_cache.get(source), module.__dict__)
+            except BaseException:
+                del self.modules[fullname]
+                raise
+        if parent is not None:
+            setattr(parent, child, module)
+        return module
+
+    def reload(self, name):
+        # Runs the module's current code again, like importlib.reload()
+        module = self.modules[name]
+        self._code_cache.forget(module.__file__)
+        exec(self._code_cache.get(module.__file__), module.__dict__)
+        return module
+
+    def boot(self, extra_wrappers=()):
+        scheduler = self.import_module("system.scheduler").scheduler
+        app_hooks.install(scheduler, extra_wrappers)
+        # Like the single badge, everything gets started by importing main
+        return self.import_module("main")
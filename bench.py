@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the emulator's own hot paths.
+
+Run the benchmarks that don't need a browser with CPython, and compare
+them with the stored baseline:
+
+    python3 bench.py --compare benchmarks/baseline-cpython.json
+
+The baseline was measured on one machine, so first save one of your own
+from a checkout without your changes:
+
+    python3 bench.py --save benchmarks/baseline-cpython.json
+
+To include the ones that draw on canvases, load the emulator with
+?bench=1. It runs the benchmarks instead of booting the OS and downloads
+the results, which can be saved and compared the same way:
+
+    python3 bench.py --save benchmarks/baseline-pyodide.json tildagon-bench.json
+    python3 bench.py --compare benchmarks/baseline-pyodide.json tildagon-bench.json
+
+Each benchmark is timed repeat times. A benchmark has regressed when its
+median time got worse by more than THRESHOLD and a Mann-Whitney U test
+says the difference is significant.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import struct
+import sys
+import time
+import zlib
+
+THRESHOLD = 0.05
+ALPHA = 0.01
+
+BENCHMARKS = []
+
+
+def benchmark(number=1000, browser=False):
+    # Registers a factory: given the emulator's namespace (or None outside
+    # the browser) it returns the function, or coroutine function, to time
+    def register(factory):
+        BENCHMARKS.append((factory.__name__, factory, number, browser))
+        return factory
+
+    return register
+
+
+@benchmark(number=2000)
+def hsv_to_rgb(env):
+    from sys_colors import hsv_to_rgb
+    return lambda: hsv_to_rgb(234, 0.14, 0.88)
+
+
+@benchmark(number=2000)
+def rgb_to_hsv(env):
+    from sys_colors import rgb_to_hsv
+    return lambda: rgb_to_hsv(193, 196, 224)
+
+
+@benchmark(number=20)
+def leds_set_all_hsv(env):
+    import leds
+    return lambda: leds.set_all_hsv(120, 1, 1)
+
+
+@benchmark(number=1)
+def message_wait_latency(env):
+    # Time from Message.set() to wait() returning
+    from async_helpers import Message
+
+    async def wait():
+        message = Message()
+        asyncio.get_event_loop().call_soon(message.set, True)
+        await message.wait()
+
+    return wait
+
+
+@benchmark(number=1000, browser=True)
+def ctx_state_changes(env):
+    ctx = env["FakeCtx"]()
+    return lambda: ctx.rgb(255, 0, 0).move_to(10, 10).gray(128)
+
+
+@benchmark(number=500, browser=True)
+def ctx_rectangle(env):
+    ctx = env["FakeCtx"]().rgb(0, 0, 255)
+    return lambda: ctx.rectangle(-50, -50, 100, 100)
+
+
+@benchmark(number=500, browser=True)
+def ctx_text(env):
+    ctx = env["FakeCtx"]().rgb(255, 255, 255).move_to(-60, 0)
+    return lambda: ctx.text("Hello Tildagon")
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png(path, width, height, rgba):
+    rows = b"".join(
+        b"\x00" + rgba[offset:offset + width * 4] for offset in range(0, len(rgba), width * 4)
+    )
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        f.write(_png_chunk(b"IDAT", zlib.compress(rows)))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+@benchmark(number=100, browser=True)
+def ctx_image(env):
+    path = "/tmp/bench.png"
+    write_png(path, 16, 16, b"\xff\x00\x00\xff" * 256)
+    ctx = env["FakeCtx"]()
+    return lambda: ctx.image(path, -8, -8, 16, 16)
+
+
+@benchmark(number=500, browser=True)
+def ctx_linear_gradient(env):
+    ctx = env["FakeCtx"]()
+    return lambda: ctx.linear_gradient(-120, 0, 120, 0).add_stop(0, (255, 0, 0), 1).add_stop(1, (0, 0, 255), 1).rectangle(-120, -120, 240, 240)
+
+
+@benchmark(number=100, browser=True)
+def neopixel_write(env):
+    modules = {}
+    env["monkey_patch_neopixel"](modules)
+    pixels = modules["neopixel"].NeoPixel(None, 12)
+    for led in range(1, 13):
+        pixels[led] = (led * 20, 0, 255 - led * 20)
+    return pixels.write
+
+
+async def _time(function, number):
+    if asyncio.iscoroutinefunction(function):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            await function()
+    else:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+    return (time.perf_counter_ns() - start) / number / 1000
+
+
+async def run(env=None, repeat=15, only=None):
+    results = {
+        "implementation": "pyodide" if env is not None else sys.implementation.name,
+        "python": sys.version.split()[0],
+        "benchmarks": {},
+    }
+    with open(os.devnull, "w") as devnull:
+        for name, factory, number, browser in BENCHMARKS:
+            if (browser and env is None) or (only and name not in only):
+                continue
+            function = factory(env)
+            # Benchmarked code may print, which isn't what's being measured
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                await _time(function, number)  # Warm up
+                samples = [await _time(function, number) for _ in range(repeat)]
+            finally:
+                sys.stdout = stdout
+            results["benchmarks"][name] = {"number": number, "samples_us": samples}
+            print(f"{name:24} {statistics.median(samples):12.2f}us")
+    return results
+
+
+def mann_whitney_p(a, b):
+    # Two sided p value from the normal approximation of the U statistic
+    ranked = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(ranked)
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        i = j + 1
+    n1, n2 = len(a), len(b)
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if sigma == 0:
+        return 1.0
+    z = abs(u - n1 * n2 / 2) / sigma
+    return math.erfc(z / math.sqrt(2))
+
+
+def compare(baseline, results):
+    regressions = []
+    for name, result in sorted(results["benchmarks"].items()):
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            print(f"{name:24} new")
+            continue
+        old = statistics.median(base["samples_us"])
+        new = statistics.median(result["samples_us"])
+        change = (new - old) / old if old else 0.0
+        p = mann_whitney_p(base["samples_us"], result["samples_us"])
+        regressed = change > THRESHOLD and p < ALPHA
+        if regressed:
+            regressions.append(name)
+        verdict = "REGRESSED" if regressed else ("faster" if change < -THRESHOLD and p < ALPHA else "")
+        print(f"{name:24} {old:10.2f}us -> {new:10.2f}us {change:+8.1%}  p={p:.3f} {verdict}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare the results with a baseline")
+    parser.add_argument("results", nargs="?", help="results to compare instead of running the benchmarks")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        results = asyncio.run(run(repeat=args.repeat, only=args.only))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Rough emulation of the badge's resource limits.
+
+The emulator runs on a desktop CPU with as much memory as the browser will
+give it, so apps that run smoothly here can stutter or run out of memory on
+the badge. With the budget enabled:
+
+* Python allocations made by each app's update() and draw() are tracked
+  with tracemalloc: what the app keeps between calls, plus the most it
+  allocates during a call, is compared against heap_size, the memory an
+  app can expect to have on the badge. Memory used by the OS and the
+  emulator isn't charged to apps.
+* The time spent in each app's update() and draw() is multiplied by
+  cpu_factor, the ratio between the badge's speed and the emulator's.
+  The difference is added to time.ticks_ms()/ticks_us() so apps see the
+  deltas they would see on the badge, and frames whose update() + draw()
+  would not fit in frame_ms on the badge are reported.
+
+cpu_factor should be calibrated: run reference_workload() on the badge,
+then pass the time it took to calibrate() in the emulator.
+
+tracemalloc slows down code that allocates. enable() measures by how much
+on reference_workload(), and times taken while tracing, both of apps and by
+calibrate(), are divided by that before being scaled, so cpu_factor is the
+same with and without heap tracking.
+"""
+import time
+
+import app_hooks
+import log
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Free heap on a badge running the OS, and a rough badge vs. desktop ratio.
+# CPython objects are larger than MicroPython's, so heap usage errs high.
+DEFAULT_HEAP_SIZE = 2 * 1024 * 1024
+DEFAULT_CPU_FACTOR = 10.0
+DEFAULT_FRAME_MS = 1000 / 30
+
+heap_size = DEFAULT_HEAP_SIZE
+cpu_factor = DEFAULT_CPU_FACTOR
+frame_ms = DEFAULT_FRAME_MS
+
+_enabled = False
+_stolen_us = 0
+_stats = {}
+# How much slower code runs while tracemalloc is tracing
+_tracing_overhead = 1.0
+
+
+class AppStats:
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.over_budget = 0
+        self.worst_ms = 0.0
+        self.frame_ms = 0.0
+        self.heap_exceeded = False
+        # Bytes allocated by the app's calls and not yet freed
+        self.heap_retained = 0
+        self.heap_peak = 0
+
+
+def reference_workload(n=20000):
+    # Keep this MicroPython compatible: it is also timed on the badge.
+    total = 0
+    values = []
+    for i in range(n):
+        total += (i * i) % 7
+        values.append(total)
+    return sum(values)
+
+
+def _time_workload(n=20000, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        reference_workload(n)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / 1000
+
+
+def _tracing():
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+def _untraced_us(elapsed_us):
+    # What elapsed_us would have been without tracemalloc
+    return elapsed_us / _tracing_overhead if _tracing() else elapsed_us
+
+
+def calibrate(badge_us, n=20000):
+    # badge_us is how long reference_workload(n) took on a real badge
+    global cpu_factor
+    emulator_us = _untraced_us(_time_workload(n))
+    cpu_factor = max(1.0, badge_us / emulator_us)
+    return cpu_factor
+
+
+def _charge(stats, name, elapsed_us):
+    # elapsed_us is how long the app's call took, as if it wasn't traced
+    global _stolen_us
+    charged_ms = elapsed_us * cpu_factor / 1000
+    _stolen_us += int(elapsed_us * (cpu_factor - 1))
+
+    stats.frame_ms += charged_ms
+    if name != "draw":
+        return
+    # A frame is everything charged to the app up to and including its draw()
+    stats.frames += 1
+    stats.worst_ms = max(stats.worst_ms, stats.frame_ms)
+    if stats.frame_ms > frame_ms:
+        stats.over_budget += 1
+        if stats.over_budget == 1 or stats.over_budget % 100 == 0:
+            log.warning(
+                "budget",
+                f"{stats.name} frame would take {stats.frame_ms:.1f}ms on the badge "
+                f"(budget {frame_ms:.1f}ms, {stats.over_budget}/{stats.frames} frames over)"
+            )
+    stats.frame_ms = 0.0
+
+
+def _charge_heap(stats, before, after, peak):
+    # before and after are the traced memory around one of the app's calls,
+    # peak the most that was traced during it
+    peak = stats.heap_retained + max(0, peak - before)
+    stats.heap_retained = max(0, stats.heap_retained + after - before)
+    stats.heap_peak = max(stats.heap_peak, peak)
+    if peak <= heap_size or stats.heap_exceeded:
+        return
+    stats.heap_exceeded = True
+    log.warning(
+        "budget",
+        f"{stats.name} used {peak // 1024}KiB of Python heap, "
+        f"the badge has {heap_size // 1024}KiB. Largest allocations:",
+    )
+    for stat in tracemalloc.take_snapshot().statistics("lineno")[:3]:
+        log.warning("budget", "   ", stat)
+
+
+def _budget_app_method(app, name, method):
+    stats = _stats.setdefault(id(app), AppStats(type(app).__name__))
+
+    def budgeted(*args, **kwargs):
+        tracing = _tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter_ns()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed_us = (time.perf_counter_ns() - start) // 1000
+            if tracing:
+                after, peak = tracemalloc.get_traced_memory()
+                _charge_heap(stats, before, after, peak)
+            _charge(stats, name, _untraced_us(elapsed_us))
+
+    return budgeted
+
+
+def _patch_ticks():
+    # Needs time.ticks_* to exist, see monkey_patch_time()
+    ticks_us = time.ticks_us
+    ticks_ms = time.ticks_ms
+    time.ticks_us = lambda: ticks_us() + _stolen_us
+    time.ticks_ms = lambda: ticks_ms() + _stolen_us // 1000
+
+
+def enable(heap=None, cpu=None, frame=None):
+    global _enabled, heap_size, cpu_factor, frame_ms, _tracing_overhead
+    if _enabled:
+        return
+    _enabled = True
+    if heap is not None:
+        heap_size = heap
+    if cpu is not None:
+        cpu_factor = cpu
+    if frame is not None:
+        frame_ms = frame
+
+    if tracemalloc is None:
+        log.warning("budget", "tracemalloc is not available, heap usage will not be tracked")
+    elif not tracemalloc.is_tracing():
+        untraced_us = _time_workload()
+        tracemalloc.start()
+        _tracing_overhead = max(1.0, _time_workload() / untraced_us)
+    _patch_ticks()
+    app_hooks.add_wrapper(_budget_app_method)
+
+
+def report():
+    return {
+        "heap_size": heap_size,
+        "cpu_factor": cpu_factor,
+        "tracing_overhead": round(_tracing_overhead, 2),
+        "frame_ms": frame_ms,
+        "apps": {
+            stats.name: {
+                "frames": stats.frames,
+                "over_budget": stats.over_budget,
+                "worst_ms": round(stats.worst_ms, 2),
+                "heap_peak": stats.heap_peak,
+                "heap_exceeded": stats.heap_exceeded,
+            }
+            for stats in _stats.values()
+        },
+    }
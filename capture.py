@@ -0,0 +1,84 @@
+"""
+Recording what the badge's screen shows.
+
+Recorders are told about each frame as it ends, from display.end_frame(),
+and must not hold up the frame: they only queue work.
+
+CanvasRecorder records a canvas in the browser. The canvas is captured as a
+stream that only takes a frame when asked to, and the browser encodes the
+stream to video on its own, with each frame timed by when it was taken.
+With an overlay canvas, the recording is of both: each frame, the screen
+and then the part of the overlay inside its clip are copied to a canvas of
+the recorder's own, which is what gets captured.
+"""
+import asyncio
+
+VIDEO_TYPES = [
+    ("video/webm;codecs=vp9", "webm"),
+    ("video/webm", "webm"),
+    ("video/mp4", "mp4"),
+]
+
+
+class CanvasRecorder:
+    def __init__(self, canvas, overlay=None):
+        from js import MediaRecorder, Object, document
+        from pyodide.ffi import create_proxy, to_js
+
+        for mime, extension in VIDEO_TYPES:
+            if MediaRecorder.isTypeSupported(mime):
+                break
+        self.mime = mime
+        self.extension = extension
+
+        self._canvas = canvas
+        self._overlay = overlay
+        if overlay is not None:
+            composited = document.createElement("canvas")
+            composited.width = canvas.width
+            composited.height = canvas.height
+            self._ctx = composited.getContext("2d")
+            canvas = composited
+        self._stream = canvas.captureStream(0)
+        self._track = self._stream.getVideoTracks()[0]
+        self._chunks = []
+        self._stopped = asyncio.get_event_loop().create_future()
+        self._recorder = MediaRecorder.new(
+            self._stream, to_js({"mimeType": mime}, dict_converter=Object.fromEntries)
+        )
+        self._on_data = create_proxy(lambda event: self._chunks.append(event.data))
+        self._on_stop = create_proxy(lambda event: self._stopped.set_result(None))
+        self._recorder.addEventListener("dataavailable", self._on_data)
+        self._recorder.addEventListener("stop", self._on_stop)
+        self._recorder.start(1000)
+        self.frames = 0
+
+    def frame(self, overlay_clip=None):
+        # overlay_clip is the (x, y, width, height) of the overlay that is
+        # shown, or None for all of it
+        if self._overlay is not None:
+            ctx = self._ctx
+            ctx.drawImage(self._canvas, 0, 0)
+            ctx.save()
+            if overlay_clip is not None:
+                ctx.beginPath()
+                ctx.rect(*overlay_clip)
+                ctx.clip()
+            ctx.drawImage(self._overlay, 0, 0)
+            ctx.restore()
+        self._track.requestFrame()
+        self.frames += 1
+
+    async def stop(self):
+        # Returns the recording as a Blob
+        from js import Blob, Object
+        from pyodide.ffi import to_js
+
+        self._recorder.stop()
+        await self._stopped
+        self._track.stop()
+        self._on_data.destroy()
+        self._on_stop.destroy()
+        return Blob.new(
+            to_js(self._chunks), to_js({"type": self.mime}, dict_converter=Object.fromEntries)
+        )
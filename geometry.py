@@ -0,0 +1,108 @@
+"""
+Cached Path2D shapes for drawing on canvases.
+
+Building a path from arc()/lineTo() calls means several calls into
+JavaScript every time a shape is drawn. The shapes here are built once, and
+then either drawn as they are or added to a bigger path with a transform.
+"""
+import math
+
+from js import DOMMatrix, Path2D
+
+# Sizes can change every frame, so don't keep every shape ever drawn
+MAX_CACHED = 256
+
+_cache = {}
+_matrix = DOMMatrix.new()
+
+
+def _store(key, path):
+    if len(_cache) >= MAX_CACHED:
+        _cache.clear()
+    _cache[key] = path
+    return path
+
+
+def circle(x, y, radius):
+    key = ("circle", x, y, radius)
+    path = _cache.get(key)
+    if path is None:
+        path = Path2D.new()
+        path.arc(x, y, radius, 0, 2 * math.pi)
+        path.closePath()
+        _store(key, path)
+    return path
+
+
+def unit_hexagon():
+    # Pointy topped, centred on the origin with its corners at radius 1
+    path = _cache.get("hexagon")
+    if path is None:
+        path = Path2D.new()
+        for corner in range(6):
+            angle = math.pi / 6 + corner * math.pi / 3
+            if corner == 0:
+                path.moveTo(math.cos(angle), math.sin(angle))
+            else:
+                path.lineTo(math.cos(angle), math.sin(angle))
+        path.closePath()
+        _store("hexagon", path)
+    return path
+
+
+def rounded_rectangle(width, height, radius):
+    # With its top left corner at the origin
+    key = ("rounded_rectangle", width, height, radius)
+    path = _cache.get(key)
+    if path is None:
+        radius = max(0, min(radius, width / 2, height / 2))
+        path = Path2D.new()
+        path.moveTo(radius, 0)
+        path.arcTo(width, 0, width, height, radius)
+        path.arcTo(width, height, 0, height, radius)
+        path.arcTo(0, height, 0, 0, radius)
+        path.arcTo(0, 0, width, 0, radius)
+        path.closePath()
+        _store(key, path)
+    return path
+
+
+def add_scaled(target, path, x, y, scale):
+    # Adds path to target, scaled about the origin then moved to (x, y)
+    _matrix.a = scale
+    _matrix.d = scale
+    _matrix.e = x
+    _matrix.f = y
+    target.addPath(path, _matrix)
+
+
+class ShapeBatch:
+    """
+    Shapes with the same fill, collected into one path so that they can be
+    filled with a single call. Anything else that draws on the canvas must
+    flush() the batch first to keep things drawn in order.
+    """
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self._path = None
+        self._style = None
+        # The last shape drawn as a Path2D, if it is the one to fill or clip
+        # to rather than the context's current path
+        self.shape = None
+
+    def add(self, style, path, x, y, scale):
+        if style != self._style:
+            self.flush()
+            self._style = style
+        if self._path is None:
+            self._path = Path2D.new()
+        add_scaled(self._path, path, x, y, scale)
+
+    def flush(self):
+        if self._path is None:
+            return
+        self._ctx.fillStyle = self._style
+        self._ctx.fill(self._path)
+        self._path = None
+        self._style = None
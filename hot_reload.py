@@ -0,0 +1,211 @@
+"""
+Reloading changed firmware and apps without reloading the page.
+
+`serve.py --watch` sends an event for each file that changes. connect()
+listens for them and apply() fetches the new file, writes it where the
+emulator keeps it, reloads the module and every module that imported
+something from it, and then restarts the apps whose code was reloaded.
+Modules are reloaded after the modules they import, so that they pick up
+the new versions of what they imported.
+
+Reloading happens in each of spaces: the interpreter's own sys.modules, or
+each badge when running several of them (see badges.Badge). Each space
+records which modules import which as the imports happen. For the
+interpreter, that needs track_imports() to be called before booting.
+
+The modules in NO_RELOAD hold the state of the running OS, reloading them
+would start a second one, or of the emulator itself, like the frame pipes in
+vsync and the wrapped apps in app_hooks. Changes to those need the page to
+be reloaded. serve.py doesn't announce changes to the emulator's files.
+"""
+import asyncio
+import builtins
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import types
+
+import app_hooks
+import log
+import snapshot
+
+
+class _Interpreter:
+    # The single badge, which imports into sys.modules
+
+    modules = sys.modules
+    # Module name -> names of the modules that imported it
+    imported_by = {}
+
+    @staticmethod
+    def path(path):
+        return path
+
+    @staticmethod
+    def reload(name):
+        module = sys.modules[name]
+        # Don't let the snapshot's import hook bring back the old code
+        snapshot.code.pop(getattr(module, "__file__", None), None)
+        return importlib.reload(module)
+
+
+spaces = [_Interpreter]
+
+NO_RELOAD = {
+    "__main__", "main", "system.scheduler", "system.eventbus",
+    # The emulator's own modules
+    "app_hooks", "badges", "budget", "geometry", "hot_reload", "log",
+    "loopback", "persist", "snapshot", "tracing", "vsync",
+}
+
+
+def module_name(target):
+    if not target.endswith(".py"):
+        return None
+    name = target[:-3].replace("/", ".")
+    if name.endswith(".__init__"):
+        name = name[:-len(".__init__")]
+    return name
+
+
+def record_import(imported_by, importer, name, fromlist):
+    imported_by.setdefault(name, set()).add(importer)
+    for item in fromlist or ():
+        # The item may be a submodule
+        if item != "*":
+            imported_by.setdefault(f"{name}.{item}", set()).add(importer)
+
+
+def track_imports():
+    # Record what each module imports into the interpreter's sys.modules
+    real_import = builtins.__import__
+
+    def __import__(name, globals=None, locals=None, fromlist=(), level=0):
+        importer = globals.get("__name__") if globals else None
+        if importer:
+            absolute = name
+            if level:
+                package = globals.get("__package__") or ""
+                absolute = importlib.util.resolve_name("." * level + name, package)
+            record_import(_Interpreter.imported_by, importer, absolute, fromlist)
+        return real_import(name, globals, locals, fromlist, level)
+
+    builtins.__import__ = __import__
+
+
+def _reloadable(modules, name, root):
+    module = modules.get(name)
+    if name in NO_RELOAD or not isinstance(module, types.ModuleType):
+        return False
+    filename = getattr(module, "__file__", None) or ""
+    return filename.startswith(root) or "/apps/" in filename
+
+
+def dependents(modules, imported_by, name):
+    # name and every firmware module that imports it, directly or not, in
+    # the order to reload them: each after the modules it imports
+    root = os.getcwd()
+    found = {name}
+    unvisited = [name]
+    while unvisited:
+        for importer in imported_by.get(unvisited.pop(), ()):
+            if importer not in found and _reloadable(modules, importer, root):
+                found.add(importer)
+                unvisited.append(importer)
+
+    # The modules in found that each of them imports
+    imports = {
+        module: {other for other in found if other != module and module in imported_by.get(other, ())}
+        for module in found
+    }
+    order = []
+    while imports:
+        ready = sorted(module for module, needed in imports.items() if not needed)
+        if not ready:
+            # They import each other, there is no right order
+            ready = sorted(imports)
+        for module in ready:
+            del imports[module]
+        for needed in imports.values():
+            needed.difference_update(ready)
+        order += ready
+    return order
+
+
+async def _call(function, *args, **kwargs):
+    # The scheduler's methods may or may not be coroutines
+    result = function(*args, **kwargs)
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
+
+
+async def restart_apps(space, reloaded):
+    scheduler_module = space.modules.get("system.scheduler")
+    if scheduler_module is None:
+        return
+    scheduler = scheduler_module.scheduler
+    for owner, app, args, kwargs in list(app_hooks.running):
+        cls = type(app)
+        if owner is not scheduler or cls.__module__ not in reloaded:
+            continue
+        new_cls = getattr(space.modules[cls.__module__], cls.__name__, None)
+        if new_cls is None:
+            continue
+        log.info("hot_reload", "Restarting", cls.__name__)
+        if hasattr(scheduler, "stop_app"):
+            await _call(scheduler.stop_app, app)
+        await _call(scheduler.start_app, new_cls(), *args, **kwargs)
+
+
+async def apply(change):
+    from pyodide.http import pyfetch
+
+    response = await pyfetch(change["source"], cache="no-store")
+    if not response.ok:
+        log.warning("hot_reload", f"Fetching {change['source']} failed: {response.status}")
+        return
+    data = await response.bytes()
+    target = change["target"]
+    name = module_name(target)
+
+    for space in spaces:
+        path = space.path(target)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    importlib.invalidate_caches()
+
+    for space in spaces:
+        if name not in space.modules:
+            continue
+        if name in NO_RELOAD:
+            log.warning("hot_reload", f"{name} changed, reload the page to use it")
+            continue
+        reloaded = dependents(space.modules, space.imported_by, name)
+        try:
+            for module in reloaded:
+                space.reload(module)
+        except Exception as e:
+            log.error("hot_reload", f"Reloading {module} failed:", repr(e))
+            continue
+        log.info("hot_reload", "Reloaded", ", ".join(reloaded))
+        await restart_apps(space, set(reloaded))
+
+
+def connect(url="/__changes"):
+    from js import EventSource
+    from pyodide.ffi import create_proxy
+
+    def on_message(event):
+        asyncio.ensure_future(apply(json.loads(event.data)))
+
+    def on_error(event):
+        log.warning("hot_reload", "Lost connection to", url, "- is serve.py running with --watch?")
+
+    source = EventSource.new(url)
+    source.addEventListener("message", create_proxy(on_message))
+    source.addEventListener("error", create_proxy(on_error))
+    return source
@@ -1,6 +1,8 @@
 from sys_colors import hsv_to_rgb
 from math import tau
 
+import log
+
 def set_rgb(ix, r, g, b):
     if r > 1:
         r /= 255
@@ -11,7 +13,7 @@ def set_rgb(ix, r, g, b):
     r = min(1.0, max(0.0, r))
     g = min(1.0, max(0.0, g))
     b = min(1.0, max(0.0, b))
-    print("Not implemented: led set_rgb", ix, r, g, b)
+    log.debug("leds", "Not implemented: led set_rgb", ix, r, g, b)
 
 
 def get_rgb(ix):
@@ -23,7 +25,7 @@ def get_steady():
 
 
 def set_all_rgb(r, g, b):
-    print("Not implemented: led set_all_rgb", r, g, b)
+    log.debug("leds", "Not implemented: led set_all_rgb", r, g, b)
 
 
 def set_hsv(ix, h, s, v):
@@ -0,0 +1,144 @@
+"""
+Logging for the emulator and its fakes.
+
+In Pyodide every print() is a synchronous write to the browser's console,
+which is far too slow for code that runs every frame or every key press.
+Messages logged here are filtered by level, limited to RATE_LIMIT a second
+from each source, and kept in a ring buffer that flush() writes out in one
+go, once per frame (see vsync.every_frame()). In the browser they go to the
+console, otherwise to the file named by TILDAGON_LOG, or stderr.
+
+Hot paths log at DEBUG, which is off unless turned on, either for
+everything with set_level(DEBUG) or for some sources with
+set_level(DEBUG, "keys").
+"""
+import collections
+import os
+import sys
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+RATE_LIMIT = 50
+BUFFER_SIZE = 1000
+
+IN_BROWSER = sys.platform == "emscripten"
+
+level = INFO
+_source_levels = {}
+_buffer = collections.deque(maxlen=BUFFER_SIZE)
+# source -> [start of the current second, messages in it, messages dropped]
+_rates = {}
+# Messages dropped because the buffer was full
+_overflowed = 0
+_file = None
+
+
+def set_level(new_level, source=None):
+    global level
+    if isinstance(new_level, str):
+        if new_level.lower() not in LEVEL_NAMES:
+            raise ValueError(f"Unknown log level {new_level!r}, use one of {', '.join(LEVEL_NAMES)}")
+        new_level = LEVEL_NAMES[new_level.lower()]
+    if source is None:
+        level = new_level
+    else:
+        _source_levels[source] = new_level
+
+
+def _append(message):
+    global _overflowed
+    if len(_buffer) == BUFFER_SIZE:
+        # The oldest message is about to be dropped
+        _overflowed += 1
+    _buffer.append(message)
+
+
+def log(message_level, source, *args):
+    if message_level < _source_levels.get(source, level):
+        return
+    now = time.monotonic()
+    rate = _rates.get(source)
+    if rate is None or now - rate[0] >= 1:
+        if rate is not None and rate[2]:
+            _append((WARNING, source, f"{rate[2]} messages dropped"))
+        rate = _rates[source] = [now, 0, 0]
+    rate[1] += 1
+    if rate[1] > RATE_LIMIT:
+        rate[2] += 1
+        return
+    _append((message_level, source, " ".join(str(arg) for arg in args)))
+    if message_level >= ERROR:
+        flush()
+
+
+def debug(source, *args):
+    log(DEBUG, source, *args)
+
+
+def info(source, *args):
+    log(INFO, source, *args)
+
+
+def warning(source, *args):
+    log(WARNING, source, *args)
+
+
+def error(source, *args):
+    log(ERROR, source, *args)
+
+
+def _write(lines, warnings, errors):
+    global _file
+    if IN_BROWSER:
+        from js import console
+        if lines:
+            console.log("\n".join(lines))
+        if warnings:
+            console.warn("\n".join(warnings))
+        if errors:
+            console.error("\n".join(errors))
+        return
+    if _file is None:
+        path = os.environ.get("TILDAGON_LOG")
+        _file = open(path, "a") if path else sys.stderr
+    _file.write("\n".join(lines + warnings + errors) + "\n")
+    _file.flush()
+
+
+def _report_drops():
+    # For sources that went quiet after being rate limited, log() reports
+    # the others when their next second starts
+    now = time.monotonic()
+    for source, rate in _rates.items():
+        if rate[2] and now - rate[0] >= 1:
+            _append((WARNING, source, f"{rate[2]} messages dropped"))
+            rate[2] = 0
+
+
+def flush():
+    global _overflowed
+    _report_drops()
+    if not _buffer:
+        return
+    lines = []
+    warnings = []
+    errors = []
+    if _overflowed:
+        warnings.append(f"[log] {_overflowed} messages dropped, more than {BUFFER_SIZE} were logged in a frame")
+        _overflowed = 0
+    while _buffer:
+        message_level, source, text = _buffer.popleft()
+        line = f"[{source}] {text}"
+        if message_level >= ERROR:
+            errors.append(line)
+        elif message_level >= WARNING:
+            warnings.append(line)
+        else:
+            lines.append(line)
+    _write(lines, warnings, errors)
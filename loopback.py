@@ -0,0 +1,134 @@
+"""
+Loopback network between badges running in one interpreter.
+
+A Hub stands in for the WiFi network the badges would share. Each badge
+gets an Endpoint with its own address; the fake network.WLAN connects
+through it, and apps can exchange datagrams with other badges through the
+endpoint's socket_module(), which stands in for MicroPython's usocket:
+
+    import usocket as socket
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.sendto(b"ping", ("10.0.0.2", 0))
+    data, address = await s.arecvfrom()
+
+Only datagram sockets are emulated, and they never block: recvfrom()
+raises EAGAIN when nothing has arrived, like with setblocking(False).
+"""
+import asyncio
+import collections
+import errno
+import types
+
+MAX_QUEUED = 64
+
+# MicroPython's values
+AF_INET = 2
+SOCK_STREAM = 1
+SOCK_DGRAM = 2
+SOL_SOCKET = 1
+SO_REUSEADDR = 4
+
+
+class LoopbackSocket:
+    def __init__(self, endpoint):
+        self._endpoint = endpoint
+        self._queue = collections.deque(maxlen=MAX_QUEUED)
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def _deliver(self, data, address):
+        self._queue.append((bytes(data), address))
+        self._ready.set()
+
+    def sendto(self, data, address):
+        return self._endpoint.hub.send(self._endpoint, data, address[0])
+
+    def recvfrom(self, bufsize=None):
+        # Non-blocking, like a MicroPython socket with setblocking(False)
+        if not self._queue:
+            raise OSError(errno.EAGAIN, "No datagram waiting")
+        data, address = self._queue.popleft()
+        if not self._queue:
+            self._ready.clear()
+        return (data if bufsize is None else data[:bufsize]), address
+
+    async def arecvfrom(self, bufsize=None):
+        while not self._queue:
+            await self._ready.wait()
+        return self.recvfrom(bufsize)
+
+    def bind(self, address):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def close(self):
+        self._closed = True
+        self._endpoint.sockets.discard(self)
+
+
+class Endpoint:
+    def __init__(self, hub, address):
+        self.hub = hub
+        self.address = address
+        self.connected = False
+        self.sockets = set()
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def peers(self):
+        return [e.address for e in self.hub.endpoints if e is not self and e.connected]
+
+    def socket(self, af=AF_INET, type=SOCK_STREAM, proto=0):
+        if af != AF_INET or type != SOCK_DGRAM:
+            raise OSError(errno.EOPNOTSUPP, "Only AF_INET datagram sockets are emulated")
+        s = LoopbackSocket(self)
+        self.sockets.add(s)
+        return s
+
+    def getaddrinfo(self, host, port, af=0, type=0, proto=0, flags=0):
+        return [(AF_INET, type or SOCK_DGRAM, proto, "", (host, port))]
+
+    def socket_module(self, name="usocket"):
+        # A socket module whose sockets are on this endpoint
+        module = types.ModuleType(name)
+        for constant in ("AF_INET", "SOCK_STREAM", "SOCK_DGRAM", "SOL_SOCKET", "SO_REUSEADDR"):
+            setattr(module, constant, globals()[constant])
+        module.socket = self.socket
+        module.getaddrinfo = self.getaddrinfo
+        module.error = OSError
+        return module
+
+
+class Hub:
+    BROADCAST = "10.0.255.255"
+
+    def __init__(self):
+        self.endpoints = []
+
+    def endpoint(self, index):
+        endpoint = Endpoint(self, f"10.0.{index // 250}.{index % 250 + 1}")
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    def send(self, source, data, address):
+        if not source.connected:
+            raise OSError(errno.ENETUNREACH, "Not connected")
+        for endpoint in self.endpoints:
+            if endpoint is source or not endpoint.connected:
+                continue
+            if address in (endpoint.address, self.BROADCAST):
+                for s in endpoint.sockets:
+                    s._deliver(data, (source.address, 0))
+        return len(data)
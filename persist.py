@@ -0,0 +1,153 @@
+"""
+Storage that survives reloading the emulator.
+
+In the browser, ROOT is an IndexedDB backed filesystem: call mount() once
+at startup to load what was stored last time, and sync() to write changes
+back. Once watch_writes() has been called, opening a file in ROOT for
+writing, or creating, removing or renaming things there, marks the storage
+dirty, and write_behind() syncs it shortly afterwards, so that writes don't
+wait on IndexedDB. Nothing is synced while nothing changes.
+
+Outside the browser, ROOT is a directory on the host, TILDAGON_STORAGE or
+~/.tildagon_emulator, and mounting and syncing are no-ops. That is where
+badges.Badge keeps each badge's files when badges are run under CPython.
+
+link() makes a directory in ROOT available at a fixed path, which is how
+/apps and /backgrounds keep their contents between loads, and link_file()
+does the same for a file, like /settings.json.
+"""
+import asyncio
+import builtins
+import os
+import shutil
+import sys
+
+import log
+
+IN_BROWSER = sys.platform == "emscripten"
+
+if IN_BROWSER:
+    ROOT = "/persist"
+else:
+    ROOT = os.environ.get("TILDAGON_STORAGE", os.path.expanduser("~/.tildagon_emulator"))
+
+# How long to wait after something changes before syncing
+SYNC_INTERVAL = 5
+
+# Functions of os that change what is stored
+OS_WRITES = ("mkdir", "remove", "unlink", "rmdir", "rename", "replace")
+
+_mounted = False
+_dirty = asyncio.Event()
+
+
+def _syncfs(populate):
+    # FS.syncfs() takes a node style callback, wrap it in a future
+    import pyodide_js
+    from pyodide.ffi import create_once_callable
+
+    future = asyncio.get_event_loop().create_future()
+
+    def done(error):
+        if error:
+            future.set_exception(OSError(str(error)))
+        else:
+            future.set_result(None)
+
+    pyodide_js.FS.syncfs(populate, create_once_callable(done))
+    return future
+
+
+async def mount():
+    global _mounted
+    if _mounted:
+        return ROOT
+    os.makedirs(ROOT, exist_ok=True)
+    if IN_BROWSER:
+        import pyodide_js
+        FS = pyodide_js.FS
+        FS.mount(FS.filesystems.IDBFS, {}, ROOT)
+        await _syncfs(True)
+    _mounted = True
+    return ROOT
+
+
+async def sync():
+    _dirty.clear()
+    if IN_BROWSER and _mounted:
+        await _syncfs(False)
+
+
+def link(path, name):
+    # Make ROOT/name available as path
+    target = os.path.join(ROOT, name)
+    os.makedirs(target, exist_ok=True)
+    if not os.path.islink(path):
+        os.symlink(target, path)
+    return target
+
+
+def link_file(path, name):
+    # Make the file ROOT/name available as path, it needn't exist yet
+    target = os.path.join(ROOT, name)
+    if not os.path.islink(path):
+        if os.path.exists(path) and not os.path.exists(target):
+            # Written before storage was set up
+            shutil.move(path, target)
+        elif os.path.exists(path):
+            os.remove(path)
+        os.symlink(target, path)
+    return target
+
+
+def mark_dirty():
+    _dirty.set()
+
+
+def is_stored(path):
+    try:
+        path = os.fsdecode(path)
+    except TypeError:
+        return False  # A file descriptor
+    return os.path.realpath(path).startswith(ROOT + os.sep)
+
+
+def watch_writes():
+    # Mark the storage dirty whenever something in it is written to
+    real_open = builtins.open
+
+    def open(file, mode="r", *args, **kwargs):
+        if not set(mode).isdisjoint("wax+") and is_stored(file):
+            mark_dirty()
+        return real_open(file, mode, *args, **kwargs)
+
+    builtins.open = open
+
+    def marking(function):
+        def write(*args, **kwargs):
+            if any(is_stored(arg) for arg in args[:2] if isinstance(arg, (str, bytes, os.PathLike))):
+                mark_dirty()
+            return function(*args, **kwargs)
+
+        write.__name__ = function.__name__
+        return write
+
+    for name in OS_WRITES:
+        setattr(os, name, marking(getattr(os, name)))
+
+
+async def write_behind():
+    # Run as a task: syncs whenever something in ROOT has changed
+    if not IN_BROWSER:
+        return
+    while True:
+        await _dirty.wait()
+        # Sync everything written in a burst together
+        await asyncio.sleep(SYNC_INTERVAL)
+        if not _dirty.is_set():
+            continue  # Already synced
+        try:
+            await sync()
+        except OSError as e:
+            log.warning("persist", "sync failed:", e)
+            mark_dirty()
@@ -1,5 +1,7 @@
 import asyncio
+import importlib
 import math
+import os
 import sys
 import time
 
@@ -7,13 +9,69 @@ from pyweb import pydom
 from pyscript import when, document
 from pyodide.ffi import to_js, create_proxy
 from js import (
+    Blob,
     CanvasRenderingContext2D as Context2d,
     ImageData,
+    Path2D,
+    URL,
+    URLSearchParams,
     Uint8ClampedArray,
     console,
     document,
+    window,
 )
 
+import app_hooks
+import badges
+import budget
+import geometry
+import log
+import loopback
+import persist
+import snapshot
+import tracing
+import vsync
+
+
+def option(name, default=None):
+    # Emulator options are passed in the page's query string,
+    # e.g. index.html?trace=1
+    value = URLSearchParams.new(window.location.search).get(name)
+    return default if value is None else value
+
+
+# Where tools only used with some options are put, see load_tool()
+TOOLS_DIR = "/tools"
+
+
+async def load_tool(name):
+    # Tools for developing the emulator, like bench, aren't in pyscript.toml
+    # so that every load doesn't have to fetch them. They are fetched from
+    # next to this file when an option needs them.
+    if name in sys.modules:
+        return sys.modules[name]
+    from pyodide.http import pyfetch
+
+    response = await pyfetch(f"./{name}.py")
+    if not response.ok:
+        raise ImportError(f"Fetching {name}.py failed: {response.status}", name=name)
+    os.makedirs(TOOLS_DIR, exist_ok=True)
+    with open(f"{TOOLS_DIR}/{name}.py", "wb") as f:
+        f.write(await response.bytes())
+    if TOOLS_DIR not in sys.path:
+        sys.path.append(TOOLS_DIR)
+    importlib.invalidate_caches()
+    return importlib.import_module(name)
+
+
+def download(data, filename, mime="application/octet-stream"):
+    blob = data if isinstance(data, Blob) else Blob.new(to_js([data]), to_js({"type": mime}))
+    link = document.createElement("a")
+    link.href = URL.createObjectURL(blob)
+    link.download = filename
+    link.click()
+    URL.revokeObjectURL(link.href)
+
 
 def monkey_patch_micropython():
     class FakeMicropython:
@@ -22,27 +80,44 @@ def monkey_patch_micropython():
             return x
 
     sys.modules["micropython"] = FakeMicropython
-    print("Implementation: " + sys.implementation.name)
+    log.info("emulator", "Implementation: " + sys.implementation.name)
     sys.implementation.name = "micropython"
-    print("Implementation is now: " + sys.implementation.name)
+    log.info("emulator", "Implementation is now: " + sys.implementation.name)
 
-def patch_filesystem():
+async def patch_filesystem():
     # New apps are downloaded to /apps and /backgrounds
     # It's hardcoded. We need to make sure files out of those
     # directories are importable.
-    import os
-    os.mkdir("/apps")
-    os.symlink("/apps", "/home/pyodide/apps")
+    # Both are kept in persistent storage, so apps survive reloading the page.
+    await persist.mount()
+    persist.link("/apps", "apps")
+    os.symlink("/apps", os.path.join(os.getcwd(), "apps"))
+
+    persist.link("/backgrounds", "backgrounds")
+    os.symlink("/backgrounds", os.path.join(os.getcwd(), "backgrounds"))
+
+    # Settings are saved to /settings.json, keep them between loads too
+    persist.link_file("/settings.json", "settings.json")
+
+    persist.watch_writes()
+    asyncio.ensure_future(persist.write_behind())
+    document.addEventListener("visibilitychange", create_proxy(flush_storage))
 
-    os.mkdir("/backgrounds")
-    os.symlink("/backgrounds", "/home/pyodide/backgrounds")
+
+def flush_storage(event):
+    # The page may be about to go away, don't wait for write_behind()
+    if document.visibilityState == "hidden":
+        asyncio.ensure_future(persist.sync())
 
 async def monkey_patch_http():
     # requests doesn't work in pyscript without this voodoo
 
-    import micropip
-    await micropip.install("pyodide-http")
-    await micropip.install("requests")
+    import importlib.util
+    if not (importlib.util.find_spec("pyodide_http") and importlib.util.find_spec("requests")):
+        # Not already restored from a snapshot
+        import micropip
+        await micropip.install("pyodide-http")
+        await micropip.install("requests")
 
     import pyodide_http
     pyodide_http.patch_all()
@@ -52,13 +127,13 @@ async def monkey_patch_http():
     # We rewrite requests via a CORS proxy because otherwise we can't fetch
     # tarballs from github/etc
     def get(url, *args, **kwargs):
-        print("Requests.get(", url, args, kwargs, ")")
+        log.debug("http", "Requests.get(", url, args, kwargs, ")")
         url = "https://api.codetabs.com/v1/proxy?quest=" + url
-        print("Request rewritten to", url)
+        log.debug("http", "Request rewritten to", url)
         try:
             return requests.real_get(url, *args, **kwargs)
         except Exception as e:
-            print("Exception in requests.get:", e)
+            log.error("http", "Exception in requests.get:", e)
             raise
 
     requests.real_get = requests.get
@@ -93,7 +168,9 @@ def monkey_patch_tildagon_helpers():
     sys.modules["tildagon_helpers"] = FakeHelpers
 
 
-def monkey_patch_network():
+def monkey_patch_network(modules=sys.modules, endpoint=None):
+    # With an endpoint, the badge is connected to other badges over a
+    # loopback.Hub instead of pretending to be on the internet
     class FakeNetwork:
         STA_IF = 0
         AP_IF = 1
@@ -103,6 +180,8 @@ def monkey_patch_network():
                 self.interface = interface
                 self._active = True
                 self._connected = True
+                if endpoint is not None:
+                    endpoint.connect()
 
             def active(self, is_active=None):
                 if is_active is None:
@@ -111,12 +190,20 @@ def monkey_patch_network():
                     self._active = is_active
 
             def connect(self, ssid, password):
-                print(f"Fake connect to SSID {ssid} with password {password}")
+                log.info("network", f"Fake connect to SSID {ssid} with password {password}")
                 self._connected = True
+                if endpoint is not None:
+                    endpoint.connect()
 
             def disconnect(self):
-                print("Fake disconnect")
+                log.info("network", "Fake disconnect")
                 self._connected = False
+                if endpoint is not None:
+                    endpoint.disconnect()
+
+            def ifconfig(self):
+                address = endpoint.address if endpoint is not None else "127.0.0.1"
+                return (address, "255.255.0.0", "10.0.0.0", "10.0.0.0")
 
             def isconnected(self):
                 return self._connected
@@ -131,7 +218,13 @@ def monkey_patch_network():
         def WLAN(self, interface):
             return self.FakeWLAN(interface)
 
-    sys.modules["network"] = FakeNetwork()
+    modules["network"] = FakeNetwork()
+    if endpoint is not None:
+        modules["usocket"] = endpoint.socket_module("usocket")
+        if modules is not sys.modules:
+            # A badge's own modules, the interpreter's socket is left alone
+            # for requests and the rest of the standard library
+            modules["socket"] = endpoint.socket_module("socket")
 
 
 def monkey_patch_time():
@@ -148,8 +241,26 @@ def monkey_patch_time():
         time.ticks_add = lambda a, b: a + b
 
 
+def monkey_patch_budget():
+    # Optionally charge apps for the badge's slower CPU and smaller heap
+    if not option("budget"):
+        return
+    heap_kb = option("heap_kb")
+    cpu_factor = option("cpu_factor")
+    frame_ms = option("frame_ms")
+    budget.enable(
+        heap=int(heap_kb) * 1024 if heap_kb else None,
+        cpu=float(cpu_factor) if cpu_factor else None,
+        frame=float(frame_ms) if frame_ms else None,
+    )
+    document.getElementById("save_budget").hidden = False
+    badge_us = option("calibrate_us")
+    if badge_us:
+        log.info("budget", "calibrated cpu_factor", budget.calibrate(float(badge_us)))
+
+
 class FakeCtx:
-    def __init__(self):
+    def __init__(self, canvas=None, batch=None):
         self.width = 240
         self.height = 240
         self.scale = 3   # The number of web pixels per "display" pixel
@@ -168,19 +279,11 @@ class FakeCtx:
         self._saves = []
         self._gradient = None
 
-        self._canvas = pydom["#screen canvas"][0]
-        self._ctx = self._canvas._js.getContext("2d")
-
-        self._ctx.beginPath()
-        self._ctx.arc(
-            (3 * self.width + 2 * self.border) / 2,
-            (3 * self.height + 2 * self.border) / 2,
-            (3 * self.width) / 2,
-            0,
-            2 * math.pi,
-        )
-        self._ctx.closePath()
-        self._ctx.clip()
+        self._canvas = canvas if canvas is not None else pydom["#screen canvas"][0]._js
+        self._ctx = self._canvas.getContext("2d")
+        # Shapes waiting to be filled, shared by every ctx for this canvas
+        self._batch = batch if batch is not None else geometry.ShapeBatch(self._ctx)
+        # The canvas is clipped to the round screen by clip_to_screen()
 
     def _x_to_web(self, x):
         return ((x + self._translate[0] + self.width // 2) * self.scale) + self.border
@@ -194,7 +297,7 @@ class FakeCtx:
         return new
 
     def clone(self):
-        ctx = FakeCtx()
+        ctx = FakeCtx(self._canvas, self._batch)
         ctx.color = self.color
         ctx.position = self.position
         return ctx
@@ -233,6 +336,7 @@ class FakeCtx:
         return new
 
     def rectangle(self, x, y, w, h):
+        self._batch.flush()
         ctx = self._ctx
         if not self._gradient:
             ctx.fillStyle = self.color
@@ -240,6 +344,28 @@ class FakeCtx:
         ctx.beginPath()
         ctx.rect(self._x_to_web(x), self._y_to_web(y), w * self.scale, h * self.scale)
         ctx.stroke()
+        self._batch.shape = None
+
+        return self
+
+    def round_rectangle(self, x, y, w, h, r):
+        self._batch.flush()
+        ctx = self._ctx
+        if not self._gradient:
+            ctx.fillStyle = self.color
+            ctx.strokeStyle = self.color
+        path = Path2D.new()
+        geometry.add_scaled(
+            path,
+            geometry.rounded_rectangle(w, h, r),
+            self._x_to_web(x),
+            self._y_to_web(y),
+            self.scale,
+        )
+        ctx.stroke(path)
+        # Instead of the context's path for fill() and clip(), as a Path2D
+        # can't be added to that
+        self._batch.shape = path
 
         return self
 
@@ -255,11 +381,12 @@ class FakeCtx:
             encoded = base64.b64encode(data).decode("utf-8")
             src = "data:image/png;base64," + encoded
         else:
-            print("Unsupported image format:", path)
+            log.warning("display", "Unsupported image format:", path)
             return self
         img = document.createElement("img")
         img.src = src
 
+        self._batch.flush()
         ctx = self._ctx
         ctx.drawImage(img, self._x_to_web(x), self._y_to_web(y), w * self.scale, h * self.scale)
         return self
@@ -277,10 +404,14 @@ class FakeCtx:
         return self
 
     def fill(self):
+        self._batch.flush()
         ctx = self._ctx
 
         ctx.fillStyle = self.color
-        ctx.fill()
+        if self._batch.shape is not None:
+            ctx.fill(self._batch.shape)
+        else:
+            ctx.fill()
 
         return self
 
@@ -289,6 +420,7 @@ class FakeCtx:
         return len(text) * 8
 
     def text(self, text):
+        self._batch.flush()
         ctx = self._ctx
 
         ctx.fillStyle = self.color
@@ -301,39 +433,128 @@ class FakeCtx:
         return self
 
     def clip(self):
+        self._batch.flush()
         ctx = self._ctx
-        ctx.clip()
+        if self._batch.shape is not None:
+            ctx.clip(self._batch.shape)
+        else:
+            ctx.clip()
+        return self
+
+    def _add_hexagon(self, x, y, dim):
+        self._batch.add(
+            self.color,
+            geometry.unit_hexagon(),
+            self._x_to_web(x),
+            self._y_to_web(y),
+            dim * self.scale,
+        )
         return self
 
 
-def monkey_patch_display():
+def monkey_patch_display(modules=sys.modules, canvas=None, overlay=None):
     # In Tildagon OS, display is a module with a set of functions.
     # In PyScript, we will make display a class then patch it into the modules
+    if canvas is None:
+        canvas = pydom["#screen canvas"][0]._js
+    if overlay is None:
+        overlay = document.querySelector("#screen canvas.overlay")
+    batch = geometry.ShapeBatch(canvas.getContext("2d"))
+    # Frames waiting for the browser to show them
+    pipe = vsync.attach(vsync.FramePipe())
+    overlay_batch = geometry.ShapeBatch(overlay.getContext("2d"))
 
     class FakeDisplay:
+        # Set to a recorder from the capture module to record each frame
+        recorder = None
+        # The part of the overlay that is shown, see set_overlay_clip()
+        overlay_clip = None
+
         @staticmethod
         def gfx_init():
-            print("Fake gfx_init()")
+            log.debug("display", "Fake gfx_init()")
 
         @staticmethod
         def hexagon(ctx, x, y, dim):
-            print("Not implemented: FakeDisplay: hexagon(%s, %s, %s)" % (x, y, dim))
+            # Hexagons of the same colour are filled together, when something
+            # else gets drawn or at the end of the frame
+            ctx._add_hexagon(x, y, dim)
 
         @staticmethod
         def get_ctx():
-            return FakeCtx()
+            return FakeCtx(canvas, batch)
+
+        # The OSD overlay is a transparent canvas on top of the screen. Like
+        # the badge's overlay it keeps what is drawn on it, and the browser
+        # composites the part inside the overlay clip over the screen, so
+        # changing the overlay never means redrawing the screen.
+        @staticmethod
+        def get_overlay_ctx():
+            return FakeCtx(overlay, overlay_batch)
+
+        @staticmethod
+        def set_overlay_clip(x, y, x2, y2):
+            top = BORDER + 3 * y
+            left = BORDER + 3 * x
+            bottom = overlay.height - (BORDER + 3 * y2)
+            right = overlay.width - (BORDER + 3 * x2)
+            overlay.style.clipPath = f"inset({top}px {right}px {bottom}px {left}px)"
+            FakeDisplay.overlay_clip = (left, top, 3 * (x2 - x), 3 * (y2 - y))
+
+        @staticmethod
+        def update_overlay():
+            overlay_batch.flush()
+            if FakeDisplay.recorder is not None:
+                FakeDisplay.recorder.frame(FakeDisplay.overlay_clip)
 
         @staticmethod
         def end_frame(ctx):
-#            print("Not implemented: FakeDisplay: end_frame()")
-            pass
+            batch.flush()
+            if pipe.submit() and FakeDisplay.recorder is not None:
+                FakeDisplay.recorder.frame(FakeDisplay.overlay_clip)
+
+        @staticmethod
+        def pipe_full():
+            return pipe.full()
+
+        @staticmethod
+        def pipe_available():
+            return not pipe.full()
 
-    sys.modules["display"] = FakeDisplay
+        @staticmethod
+        def fps():
+            return pipe.fps()
+
+    FakeDisplay.canvas = canvas
+    FakeDisplay.pipe = pipe
+    FakeDisplay.overlay = overlay
+
+    modules["display"] = FakeDisplay
 
     class FakeGC9A01PY:
         pass
 
-    sys.modules["gc9a01py"] = FakeGC9A01PY
+    modules["gc9a01py"] = FakeGC9A01PY
+
+
+def pacing_wrappers(display):
+    # Skip drawing frames while the display's pipe is full: the browser
+    # wouldn't get to show them. pacing=0 draws every frame.
+    if option("pacing") == "0":
+        return []
+
+    def pace(app, name, method):
+        if name != "draw":
+            return method
+
+        def draw(*args, **kwargs):
+            if display.pipe_full():
+                return None
+            return method(*args, **kwargs)
+
+        return draw
+
+    return [pace]
 
 
 def monkey_patch_machine():
@@ -424,7 +645,7 @@ def monkey_patch_ePin():
     sys.modules["egpio.ePin"] = FakeEPin
 
 
-def monkey_patch_neopixel():
+def monkey_patch_neopixel(modules=sys.modules, led_canvases=None):
     class FakeNeoPixel:
         def __init__(self, *args, **kwargs):
             self.length = 12
@@ -432,68 +653,70 @@ def monkey_patch_neopixel():
 
         def write(self):
             for led in range(self.length):
-                canvas = pydom[f"#led{led} canvas"][0]
-                ctx = canvas._js.getContext("2d")
+                if led_canvases is not None:
+                    canvas = led_canvases[led]
+                else:
+                    canvas = pydom[f"#led{led} canvas"][0]._js
+                ctx = canvas.getContext("2d")
                 style = f"rgb({self.rgb[led][0]} {self.rgb[led][1]} {self.rgb[led][2]})"
                 ctx.fillStyle = style
-                ctx.beginPath()
-                ctx.arc(10, 10, 10, 0, 2 * math.pi)
-                ctx.fill()
-                ctx.closePath()
-                canvas.style["display"] = "block"
+                ctx.fill(geometry.circle(10, 10, 10))
+                canvas.style.display = "block"
 
         def fill(self, color):
-            print("Not yet implemented: FakeNeoPixel: fill", color)
+            log.debug("neopixel", "Not yet implemented: FakeNeoPixel: fill", color)
 
         def __setitem__(self, item, value):
             if item > self.length:
-                print("FakeNeoPixel: Ignoring setitem out of range", item)
+                log.debug("neopixel", "FakeNeoPixel: Ignoring setitem out of range", item)
             else:
                 self.rgb[item-1] = value
 
     class FakeNeoPixelModule:
         NeoPixel = FakeNeoPixel
 
-    sys.modules["neopixel"] = FakeNeoPixelModule
+    modules["neopixel"] = FakeNeoPixelModule
 
 
-async def badge():
-    resolution_x = 240
-    resolution_y = 240
-    border = 10
+RESOLUTION_X = 240
+RESOLUTION_Y = 240
+BORDER = 10
+
+# When running several badges, the one that buttons and keys are sent to
+focused_badge = None
+all_badges = []
+
+
+def clip_to_screen(canvas):
+    # Once per canvas, after anything outside the screen has been drawn
+    canvas.getContext("2d").clip(
+        geometry.circle(
+            (3 * RESOLUTION_X + 2 * BORDER) / 2,
+            (3 * RESOLUTION_Y + 2 * BORDER) / 2,
+            (3 * RESOLUTION_X) / 2,
+        )
+    )
 
-    # FIXME: for now draw leds as a grey circle
-    #        - we need to lay them out properly in the HTML
-    #        - we need to hook them up to the code
-    for led in range(6):
-        canvas = pydom[f"#led{led} canvas"][0]
-        ctx = canvas._js.getContext("2d")
-        ctx.fillStyle = "rgb(100 100 100)"
-        ctx.beginPath()
-        ctx.arc(10, 10, 5, 0, 2 * math.pi)
-        ctx.fill()
-        ctx.closePath()
-        canvas.style["display"] = "block"
 
-    canvas = pydom["#screen canvas"][0]
-    ctx = canvas._js.getContext("2d")
+def setup_screen(canvas):
+    ctx = canvas.getContext("2d")
 
     # Set the canvas size
-    width = 3 * resolution_x + 2 * border
-    height = 3 * resolution_y + 2 * border
+    width = 3 * RESOLUTION_X + 2 * BORDER
+    height = 3 * RESOLUTION_Y + 2 * BORDER
 
-    canvas.style["width"] = f"{width}px"
-    canvas.style["height"] = f"{height}px"
-    canvas._js.width = width
-    canvas._js.height = height
+    canvas.style.width = f"{width}px"
+    canvas.style.height = f"{height}px"
+    canvas.width = width
+    canvas.height = height
 
     # Draw a green circle for the screen border
     ctx.fillStyle = "rgb(0 100 0)"
     ctx.beginPath()
     ctx.arc(
-        (3 * resolution_x + 2 * border) / 2,
-        (3 * resolution_y + 2 * border) / 2,
-        (3 * resolution_x + 2 * border) / 2,
+        (3 * RESOLUTION_X + 2 * BORDER) / 2,
+        (3 * RESOLUTION_Y + 2 * BORDER) / 2,
+        (3 * RESOLUTION_X + 2 * BORDER) / 2,
         0,
         2 * math.pi,
     )
@@ -504,75 +727,300 @@ async def badge():
     ctx.fillStyle = "rgb(0 0 0)"
     ctx.beginPath()
     ctx.arc(
-        (3 * resolution_x + 2 * border) / 2,
-        (3 * resolution_y + 2 * border) / 2,
-        (3 * resolution_x) / 2,
+        (3 * RESOLUTION_X + 2 * BORDER) / 2,
+        (3 * RESOLUTION_Y + 2 * BORDER) / 2,
+        (3 * RESOLUTION_X) / 2,
         0,
         2 * math.pi,
     )
     ctx.fill()
     ctx.closePath()
+    clip_to_screen(canvas)
 
     # Show the canvas
-    canvas.style["display"] = "block"
+    canvas.style.display = "block"
+
+
+def setup_overlay(overlay):
+    # Exactly covers the screen, which is the overlay's positioned parent
+    overlay.width = 3 * RESOLUTION_X + 2 * BORDER
+    overlay.height = 3 * RESOLUTION_Y + 2 * BORDER
+    overlay.style.position = "absolute"
+    overlay.style.top = "0"
+    overlay.style.left = "0"
+    overlay.style.pointerEvents = "none"
+    overlay.style.display = "block"
+    clip_to_screen(overlay)
+
+
+async def badge():
+    # FIXME: for now draw leds as a grey circle
+    #        - we need to lay them out properly in the HTML
+    #        - we need to hook them up to the code
+    for led in range(6):
+        canvas = pydom[f"#led{led} canvas"][0]
+        ctx = canvas._js.getContext("2d")
+        ctx.fillStyle = "rgb(100 100 100)"
+        ctx.beginPath()
+        ctx.arc(10, 10, 5, 0, 2 * math.pi)
+        ctx.fill()
+        ctx.closePath()
+        canvas.style["display"] = "block"
+
+    setup_screen(pydom["#screen canvas"][0]._js)
+    setup_overlay(document.querySelector("#screen canvas.overlay"))
+
+    if option("bench"):
+        await run_benchmarks()
+        return
 
     await start_tildagon_os()
 
 
+async def run_benchmarks():
+    # Benchmarks the emulator instead of booting the OS, see bench.py
+    import json
+
+    bench = await load_tool("bench")
+
+    results = await bench.run(globals(), only=option("only", "").split(",") if option("only") else None)
+    download(json.dumps(results, indent=1), "tildagon-bench.json", "application/json")
+
+
+def add_badge_elements(index):
+    # Badge 0 uses the page's own screen and LEDs, the others get a copy
+    if index == 0:
+        screen = pydom["#screen canvas"][0]._js
+        overlay = document.querySelector("#screen canvas.overlay")
+        leds = [pydom[f"#led{led} canvas"][0]._js for led in range(12)]
+        return screen, overlay, leds
+
+    container = document.createElement("div")
+    container.id = f"badge{index}"
+    led_row = document.createElement("div")
+    leds = []
+    for led in range(12):
+        canvas = document.createElement("canvas")
+        canvas.width = 20
+        canvas.height = 20
+        led_row.appendChild(canvas)
+        leds.append(canvas)
+    screen_div = document.createElement("div")
+    screen_div.style.position = "relative"
+    screen = document.createElement("canvas")
+    overlay = document.createElement("canvas")
+    overlay.className = "overlay"
+    screen_div.appendChild(screen)
+    screen_div.appendChild(overlay)
+    container.appendChild(led_row)
+    container.appendChild(screen_div)
+    document.getElementById("badges").appendChild(container)
+    setup_screen(screen)
+    setup_overlay(overlay)
+    return screen, overlay, leds
+
+
+def focus_badge(badge):
+    global focused_badge
+    focused_badge = badge
+    for other in all_badges:
+        outline = "3px solid orange" if other is badge else "none"
+        other.screen.style.outline = outline
+
+
+def start_badges(count):
+    hub = loopback.Hub()
+    code_cache = badges.CodeCache(snapshot.code)
+    for index in range(count):
+        screen, overlay, leds = add_badge_elements(index)
+        fakes = {}
+        monkey_patch_display(fakes, screen, overlay)
+        monkey_patch_neopixel(fakes, leds)
+        monkey_patch_network(fakes, hub.endpoint(index))
+
+        badge = badges.Badge(index, fakes, code_cache)
+        badge.screen = screen
+        screen.addEventListener("click", create_proxy(lambda event, badge=badge: focus_badge(badge)))
+        all_badges.append(badge)
+        badge.boot(pacing_wrappers(fakes["display"]))
+    focus_badge(all_badges[0])
+    return code_cache
+
+
+def firmware_import(name):
+    # Import from the focused badge when running more than one
+    if focused_badge is not None:
+        return focused_badge.import_module(name)
+    return importlib.import_module(name)
+
+
 async def button_handler(event):
-    print("Button pressed:", event.target.id)
+    log.debug("buttons", "Button pressed:", event.target.id)
 
-    from system.eventbus import eventbus
-    from frontboards.twentyfour import BUTTONS
-    from events.input import ButtonDownEvent, ButtonUpEvent
-    print("Emitting ButtonDownEvent for button", BUTTONS[event.target.id])
+    eventbus = firmware_import("system.eventbus").eventbus
+    BUTTONS = firmware_import("frontboards.twentyfour").BUTTONS
+    ButtonDownEvent = firmware_import("events.input").ButtonDownEvent
+    log.debug("buttons", "Emitting ButtonDownEvent for button", BUTTONS[event.target.id])
     await eventbus.emit_async(ButtonDownEvent(button=BUTTONS[event.target.id]))
 
+
+def save_trace(event):
+    download(tracing.dumps(), "tildagon-trace.json", "application/json")
+
+
+def save_budget_report(event):
+    import json
+
+    download(json.dumps(budget.report(), indent=1), "tildagon-budget.json", "application/json")
+
+
+# The display being recorded, if any
+recording = None
+
+
+async def toggle_recording(event):
+    global recording
+    button = document.getElementById("record")
+    if recording is None:
+        capture = await load_tool("capture")
+        display = firmware_import("display")
+        # The screen with the overlay composited over it
+        display.recorder = capture.CanvasRecorder(display.canvas, display.overlay)
+        recording = display
+        button.innerText = "Stop recording"
+        return
+
+    display, recording = recording, None
+    recorder, display.recorder = display.recorder, None
+    button.innerText = "Record"
+    video = await recorder.stop()
+    log.info("capture", f"Recorded {recorder.frames} frames")
+    download(video, f"tildagon-recording.{recorder.extension}")
+
+
 @create_proxy
 async def on_key_down(event):
 
-    from system.eventbus import eventbus
-    from frontboards.twentyfour import BUTTONS
-    from events.input import ButtonDownEvent, ButtonUpEvent
+    eventbus = firmware_import("system.eventbus").eventbus
+    BUTTONS = firmware_import("frontboards.twentyfour").BUTTONS
+    ButtonDownEvent = firmware_import("events.input").ButtonDownEvent
     match event.key:
         case "ArrowUp":
-            print("Emitting ButtonDownEvent for button A")
+            log.debug("keys", "Emitting ButtonDownEvent for button A")
             await eventbus.emit_async(ButtonDownEvent(button=BUTTONS["A"]))
         case "ArrowDown":
-            print("Emitting ButtonDownEvent for button D")
+            log.debug("keys", "Emitting ButtonDownEvent for button D")
             await eventbus.emit_async(ButtonDownEvent(button=BUTTONS["D"]))
         case "ArrowLeft":
-            print("Emitting ButtonDownEvent for button F")
+            log.debug("keys", "Emitting ButtonDownEvent for button F")
             await eventbus.emit_async(ButtonDownEvent(button=BUTTONS["F"]))
         case "ArrowRight":
-            print("Emitting ButtonDownEvent for button C")
+            log.debug("keys", "Emitting ButtonDownEvent for button C")
             await eventbus.emit_async(ButtonDownEvent(button=BUTTONS["C"]))
         case _:
-            print("Key down:", event.key, "code:", event.code)
+            log.debug("keys", "Key down:", event.key, "code:", event.code)
+
+
+async def load_hot_reload():
+    # Reload changed files announced by serve.py --watch. What imports what
+    # is recorded from the start, so this must run before the OS boots.
+    if not option("hot"):
+        return None
+    hot_reload = await load_tool("hot_reload")
+    hot_reload.track_imports()
+    return hot_reload
+
+
+def start_hot_reload(hot_reload):
+    if hot_reload is None:
+        return
+    if all_badges:
+        hot_reload.spaces = all_badges
+    hot_reload.connect()
+
+
+async def restore_snapshot():
+    # snapshot=0 boots from scratch, snapshot=clear also forgets the snapshot
+    if option("snapshot") == "0":
+        return False
+    if option("snapshot") == "clear":
+        snapshot.clear()
+        return False
+    restored = snapshot.restore()
+    if restored:
+        log.info("snapshot", "warm start")
+    return restored
+
+
+async def save_snapshot(compiled=None):
+    if option("snapshot") == "0":
+        return
+    size = snapshot.save(compiled=compiled)
+    await persist.sync()
+    log.info("snapshot", f"saved {size // 1024}KiB for the next load")
 
 
 async def start_tildagon_os():
+    hot_reload = await load_hot_reload()
+
     # Fix up differences between MicroPython and PyScript
     monkey_patch_time()
-    monkey_patch_display()
+    monkey_patch_budget()
     monkey_patch_machine()
     monkey_patch_tildagon()
-    monkey_patch_neopixel()
     monkey_patch_ePin()
     monkey_patch_sys()
-    monkey_patch_network()
     monkey_patch_tildagon_helpers()
     monkey_patch_micropython()
+    await patch_filesystem()
+    warm = await restore_snapshot()
     await monkey_patch_http()
-    patch_filesystem()
 
     document.addEventListener("keydown", on_key_down)
 
+    count = int(option("badges", 1))
+    if count > 1:
+        # Every badge gets its own display, LEDs and network
+        code_cache = start_badges(count)
+        start_hot_reload(hot_reload)
+        if not warm:
+            await save_snapshot(code_cache.code)
+        return
+
+    monkey_patch_display()
+    monkey_patch_neopixel()
+    # A network of its own, so apps can use usocket like with several
+    monkey_patch_network(endpoint=loopback.Hub().endpoint(0))
+
+    from system.scheduler import scheduler
+    app_hooks.install(scheduler, pacing_wrappers(sys.modules["display"]))
+
     import main
     # Everything gets started on the import above
 
+    start_hot_reload(hot_reload)
+    if not warm:
+        await save_snapshot()
+
+
+def configure_logging():
+    # log=debug logs everything, debug=keys,http only some sources
+    if option("log"):
+        try:
+            log.set_level(option("log"))
+        except ValueError as e:
+            log.warning("emulator", e)
+    for source in filter(None, option("debug", "").split(",")):
+        log.set_level(log.DEBUG, source)
+    vsync.every_frame(log.flush)
+
 
 async def main():
+    configure_logging()
+    if option("trace"):
+        tracing.enable()
+        document.getElementById("save_trace").hidden = False
+
     _ = await asyncio.gather(badge())
 
 asyncio.ensure_future(main())
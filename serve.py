@@ -1,10 +1,112 @@
 #!/usr/bin/env python3
-from http.server import HTTPServer, SimpleHTTPRequestHandler, test
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+import time
+from http.server import HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer, test
+
+# Changed files are announced to emulators with --watch at this path
+CHANGES_PATH = "/__changes"
+# Only the firmware and apps are reloaded, the emulator's own files need
+# the page to be reloaded
+FIRMWARE_DIR = "./badge-2024-software/"
+POLL_INTERVAL = 0.25
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
 
 class CORSRequestHandler (SimpleHTTPRequestHandler):
     def end_headers (self):
         self.send_header('Access-Control-Allow-Origin', '*')
         SimpleHTTPRequestHandler.end_headers(self)
 
+
+class WatchingRequestHandler(CORSRequestHandler):
+    def do_GET(self):
+        if self.path != CHANGES_PATH:
+            return super().do_GET()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        changes = queue.Queue()
+        with _listeners_lock:
+            _listeners.append(changes)
+        try:
+            while True:
+                try:
+                    change = changes.get(timeout=15)
+                    self.wfile.write(f"data: {json.dumps(change)}\n\n".encode())
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with _listeners_lock:
+                _listeners.remove(changes)
+
+
+def watched_files(apps_dirs):
+    # Maps the firmware and app files the emulator loads to where the
+    # emulator puts them
+    files = {}
+    with open("pyscript.toml") as f:
+        in_files = False
+        for line in f:
+            if line.startswith("["):
+                in_files = line.strip() == "[files]"
+            match = re.match(r'\s*"([^"]+)"\s*=\s*"([^"]+)"', line)
+            if in_files and match and match.group(1).startswith(FIRMWARE_DIR):
+                files[match.group(1)] = match.group(2)
+
+    for apps_dir in apps_dirs:
+        for directory, _, filenames in os.walk(apps_dir):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                target = os.path.join("apps", os.path.relpath(path, os.path.dirname(os.path.abspath(apps_dir))))
+                files["./" + os.path.relpath(path)] = target
+    return files
+
+
+def watch(apps_dirs):
+    mtimes = None
+    while True:
+        previous, mtimes = mtimes, {}
+        for source, target in watched_files(apps_dirs).items():
+            try:
+                mtime = os.stat(source).st_mtime_ns
+            except OSError:
+                continue
+            # New files count as changed, except on the first look
+            if previous is not None and previous.get(source) != mtime:
+                print("Changed:", source)
+                with _listeners_lock:
+                    for changes in _listeners:
+                        changes.put({"source": source, "target": target})
+            mtimes[source] = mtime
+        time.sleep(POLL_INTERVAL)
+
+
 if __name__ == '__main__':
-    test(CORSRequestHandler, HTTPServer, port=8000)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--watch", action="store_true",
+                        help="tell emulators loaded with ?hot=1 when files change")
+    parser.add_argument("--apps", action="append", default=[], metavar="DIR",
+                        help="directory of an app to watch, it must be under this directory")
+    args = parser.parse_args()
+
+    if not args.watch:
+        test(CORSRequestHandler, HTTPServer, port=8000)
+    else:
+        for apps_dir in args.apps:
+            if os.path.relpath(apps_dir).startswith(".."):
+                parser.error(f"{apps_dir} isn't under {os.getcwd()}, so it can't be served")
+        threading.Thread(target=watch, args=(args.apps,), daemon=True).start()
+        print("Watching for changes, load the emulator with ?hot=1")
+        test(WatchingRequestHandler, ThreadingHTTPServer, port=8000)
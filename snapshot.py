@@ -0,0 +1,150 @@
+"""
+Warm start snapshots of a booted emulator.
+
+Booting the emulator installs packages with micropip, compiles all of the
+firmware and sets up the filesystem before the OS even starts. Once the OS
+has booted, save() stores what that work produced in persistent storage:
+
+* the packages in site-packages, so micropip doesn't need to run again,
+* the compiled code of every firmware module that was imported.
+
+Downloaded apps and backgrounds don't need to be part of the snapshot,
+they are kept in persistent storage anyway (see persist.link()).
+
+On the next load, restore() puts all of that back, and installs an import
+hook that uses the stored code instead of compiling the firmware again.
+
+Pyodide's own memory snapshots would be faster still, but they have to be
+passed to loadPyodide(), which PyScript calls for us.
+
+Snapshots are tied to a hash of the firmware, emulator and Python version,
+so changing any of them means the next load boots from scratch.
+"""
+import hashlib
+import importlib
+import importlib.machinery
+import io
+import json
+import marshal
+import os
+import shutil
+import sys
+import sysconfig
+import zipfile
+
+import log
+import persist
+
+SKIP_DIRS = {"__pycache__", "apps", "backgrounds"}
+
+code = {}
+
+
+def path():
+    return os.path.join(persist.ROOT, "snapshot.zip")
+
+
+def firmware_hash(root=None):
+    root = root or os.getcwd()
+    digest = hashlib.sha256(sys.version.encode())
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                filename = os.path.join(directory, filename)
+                digest.update(os.path.relpath(filename, root).encode())
+                with open(filename, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+class _CachedLoader(importlib.machinery.SourceFileLoader):
+    def get_code(self, fullname):
+        cached = code.get(self.path)
+        if cached is not None:
+            return cached
+        return super().get_code(fullname)
+
+
+class _CachedCodeFinder:
+    # Uses code from the snapshot for firmware found by the normal path finder
+
+    @staticmethod
+    def find_spec(fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is not None and spec.origin in code:
+            spec.loader = _CachedLoader(fullname, spec.origin)
+        return spec
+
+
+def _add_tree(archive, source, name):
+    if os.path.isdir(source):
+        for directory, _, filenames in os.walk(source):
+            for filename in filenames:
+                filename = os.path.join(directory, filename)
+                archive.write(filename, name + "/" + os.path.relpath(filename, source))
+    elif os.path.isfile(source):
+        archive.write(source, name)
+
+
+def save(root=None, compiled=None):
+    # compiled maps filenames to code for firmware that isn't in sys.modules
+    root = root or os.getcwd()
+    firmware = dict(compiled or {})
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None) or ""
+        if filename.startswith(root + "/") and filename.endswith(".py") and filename not in firmware:
+            with open(filename) as f:
+                firmware[filename] = compile(f.read(), filename, "exec")
+
+    site_packages = sysconfig.get_paths()["purelib"]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("meta.json", json.dumps({"hash": firmware_hash(root)}))
+        archive.writestr("code.marshal", marshal.dumps(firmware))
+        for entry in os.listdir(site_packages):
+            if entry != "__pycache__":
+                _add_tree(archive, os.path.join(site_packages, entry), "site-packages/" + entry)
+
+    with open(path(), "wb") as f:
+        f.write(buffer.getvalue())
+    return len(buffer.getvalue())
+
+
+def _extract(archive, prefix, target):
+    for name in archive.namelist():
+        if not name.startswith(prefix + "/") or name.endswith("/"):
+            continue
+        destination = os.path.join(target, name[len(prefix) + 1:])
+        if os.path.exists(destination):
+            continue
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with archive.open(name) as source, open(destination, "wb") as f:
+            shutil.copyfileobj(source, f)
+
+
+def restore(root=None):
+    # Returns True if a snapshot matching the current firmware was restored
+    try:
+        archive = zipfile.ZipFile(path())
+    except (OSError, zipfile.BadZipFile):
+        return False
+    with archive:
+        meta = json.loads(archive.read("meta.json"))
+        if meta.get("hash") != firmware_hash(root):
+            log.info("snapshot", "firmware has changed, booting from scratch")
+            return False
+        code.update(marshal.loads(archive.read("code.marshal")))
+        _extract(archive, "site-packages", sysconfig.get_paths()["purelib"])
+
+    importlib.invalidate_caches()
+    if _CachedCodeFinder not in sys.meta_path:
+        sys.meta_path.insert(0, _CachedCodeFinder)
+    return True
+
+
+def clear():
+    try:
+        os.remove(path())
+    except FileNotFoundError:
+        pass
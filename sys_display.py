@@ -1,9 +1,11 @@
 def pipe_full():
-    return False
+    import display
+    return display.pipe_full()
 
 
 def pipe_available():
-    return True
+    import display
+    return display.pipe_available()
 
 
 def get_mode():
@@ -27,20 +29,27 @@ def fb(mode):
 
 
 def fps():
-    return 60.0
+    import display
+    return display.fps()
 
 
+# The overlay is drawn by the fake display module, see monkey_patch_display()
+
 def update(subctx):
-    print("Not implemented sys_display.update()", subctx)
+    import display
+    display.update_overlay()
 
 def get_ctx():
-    print("Not implemented sys_display.get_ctx()")
+    import display
+    return display.get_ctx()
 
 def get_overlay_ctx():
-    print("Not implemented sys_display.get_overlay_ctx()")
+    import display
+    return display.get_overlay_ctx()
 
 def set_overlay_clip(x, y, x2, y2):
-    print("Not implemented sys_display.set_overlay_clip()", x, y, x2, y2)
+    import display
+    display.set_overlay_clip(x, y, x2, y2)
 
 osd = 256
 
@@ -0,0 +1,120 @@
+import os
+import textwrap
+
+import pytest
+
+import badges
+
+
+@pytest.fixture
+def firmware(tmp_path, monkeypatch):
+    monkeypatch.setattr(badges, "BADGES_ROOT", str(tmp_path / "badges"))
+    root = tmp_path / "firmware"
+    root.mkdir()
+
+    def write(name, source):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(textwrap.dedent(source))
+
+    write.root = str(root)
+    return write
+
+
+def make_badge(firmware, index, fakes=None):
+    return badges.Badge(index, fakes or {}, badges.CodeCache(), firmware.root)
+
+
+def test_badges_have_their_own_modules(firmware):
+    firmware("counter.py", """
+        count = 0
+    """)
+    firmware("system/__init__.py", "")
+    firmware("system/counting.py", """
+        import counter
+        from counter import count as start
+
+        def bump():
+            counter.count += 1
+            return counter.count
+    """)
+    one = make_badge(firmware, 1)
+    two = make_badge(firmware, 2)
+    assert one.import_module("system.counting").bump() == 1
+    assert one.import_module("system.counting").bump() == 2
+    assert two.import_module("system.counting").bump() == 1
+    assert one.modules["counter"] is not two.modules["counter"]
+    assert one.modules["system"].counting is one.modules["system.counting"]
+
+
+def test_fakes_are_imported_instead_of_firmware(firmware):
+    firmware("uses_display.py", """
+        import display
+        from display import name
+    """)
+    display = type("display", (), {"name": "fake"})
+    badge = make_badge(firmware, 1, {"display": display})
+    assert badge.import_module("uses_display").name == "fake"
+
+
+def test_settings_are_private_to_each_badge(firmware):
+    firmware("settings.py", """
+        import json
+        import os
+        import os.path
+        from os.path import exists, getsize
+
+        def save(value):
+            with open("/settings.json", "w") as f:
+                json.dump(value, f)
+
+        def load():
+            if not os.path.exists("/settings.json"):
+                return None
+            assert exists("/settings.json") and getsize("/settings.json") > 0
+            assert os.path.isfile("/settings.json") and os.path.isdir("/apps")
+            assert "settings.json" not in os.listdir("/apps")
+            with open("/settings.json") as f:
+                return json.load(f)
+    """)
+    one = make_badge(firmware, 1)
+    two = make_badge(firmware, 2)
+    one.import_module("settings").save({"name": "one"})
+    assert one.import_module("settings").load() == {"name": "one"}
+    assert two.import_module("settings").load() is None
+    assert os.path.isfile(os.path.join(one.fs_root, "settings.json"))
+    assert not os.path.exists(os.path.join(two.fs_root, "settings.json"))
+
+
+def test_stdlib_file_helpers_write_to_the_badge(firmware, tmp_path):
+    source = tmp_path / "app.py"
+    source.write_text("print('hello')\n")
+    firmware("installer.py", f"""
+        import io
+        import os
+        import shutil
+        import tarfile
+
+        def install():
+            os.makedirs("/apps/copied", exist_ok=True)
+            shutil.copyfile({str(source)!r}, "/apps/copied/app.py")
+
+            data = io.BytesIO()
+            with tarfile.open(fileobj=data, mode="w") as t:
+                t.add({str(source)!r}, arcname="extracted/app.py")
+            data.seek(0)
+            with tarfile.open(fileobj=data) as t:
+                t.extractall("/apps", filter="data")
+
+        def remove():
+            shutil.rmtree("/apps/copied")
+    """)
+    badge = make_badge(firmware, 1)
+    installer = badge.import_module("installer")
+    installer.install()
+    apps = os.path.join(badge.fs_root, "apps")
+    assert sorted(os.listdir(apps)) == ["copied", "extracted"]
+    assert os.path.isfile(os.path.join(apps, "extracted", "app.py"))
+    assert badge.modules["shutil"] is not make_badge(firmware, 2).import_module("installer").shutil
+    installer.remove()
+    assert os.listdir(apps) == ["extracted"]
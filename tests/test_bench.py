@@ -0,0 +1,31 @@
+import pytest
+
+import bench
+
+
+def test_identical_samples_are_not_significant():
+    samples = [10.0, 11.0, 12.0, 13.0, 14.0] * 3
+    assert bench.mann_whitney_p(samples, list(samples)) == pytest.approx(1.0)
+
+
+def test_separate_samples_are_significant():
+    fast = [10.0 + i / 10 for i in range(15)]
+    slow = [20.0 + i / 10 for i in range(15)]
+    assert bench.mann_whitney_p(fast, slow) < 0.001
+    assert bench.mann_whitney_p(slow, fast) == pytest.approx(bench.mann_whitney_p(fast, slow))
+
+
+def test_all_equal_samples():
+    assert bench.mann_whitney_p([1.0] * 5, [1.0] * 5) == pytest.approx(1.0)
+
+
+def results(samples):
+    return {"benchmarks": {"leds": {"number": 1, "samples_us": samples}}}
+
+
+def test_compare_finds_regressions():
+    base = [10.0 + i / 10 for i in range(15)]
+    assert bench.compare(results(base), results([x * 1.5 for x in base])) == ["leds"]
+    # Faster, or slower by less than THRESHOLD, isn't a regression
+    assert bench.compare(results(base), results([x * 0.5 for x in base])) == []
+    assert bench.compare(results(base), results([x * 1.01 for x in base])) == []
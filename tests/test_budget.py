@@ -0,0 +1,86 @@
+import tracemalloc
+
+import pytest
+
+import budget
+
+
+@pytest.fixture(autouse=True)
+def reset(monkeypatch):
+    monkeypatch.setattr(budget, "cpu_factor", 10.0)
+    monkeypatch.setattr(budget, "frame_ms", 1000 / 30)
+    monkeypatch.setattr(budget, "heap_size", 1024 * 1024)
+    monkeypatch.setattr(budget, "_stolen_us", 0)
+    monkeypatch.setattr(budget, "_tracing_overhead", 1.0)
+
+
+def test_charge_scales_time_and_counts_frames():
+    stats = budget.AppStats("App")
+    budget._charge(stats, "update", 1000)
+    budget._charge(stats, "draw", 1000)
+    assert stats.frames == 1
+    assert stats.worst_ms == pytest.approx(20.0)
+    assert stats.over_budget == 0
+    assert budget._stolen_us == 2 * 9000
+
+    budget._charge(stats, "update", 2000)
+    budget._charge(stats, "draw", 2000)
+    assert stats.frames == 2
+    assert stats.over_budget == 1
+    assert stats.frame_ms == 0.0
+
+
+def test_untraced_time_removes_tracing_overhead(monkeypatch):
+    monkeypatch.setattr(budget, "_tracing_overhead", 4.0)
+    monkeypatch.setattr(budget, "_tracing", lambda: True)
+    assert budget._untraced_us(4000) == 1000
+    monkeypatch.setattr(budget, "_tracing", lambda: False)
+    assert budget._untraced_us(4000) == 4000
+
+
+class App:
+    def __init__(self, size):
+        self.size = size
+        self.kept = []
+
+    def update(self, delta):
+        self.kept.append(bytearray(self.size))
+
+    def draw(self, ctx):
+        bytearray(4 * self.size)
+
+
+@pytest.fixture
+def tracing():
+    tracemalloc.start()
+    yield
+    tracemalloc.stop()
+
+
+def test_heap_is_charged_to_the_app_not_the_interpreter(tracing):
+    # Memory allocated outside the app's calls doesn't count
+    elsewhere = bytearray(4 * 1024 * 1024)
+    app = App(1024)
+    update = budget._budget_app_method(app, "update", app.update)
+    draw = budget._budget_app_method(app, "draw", app.draw)
+    for _ in range(10):
+        update(0)
+        draw(None)
+    stats = budget._stats.pop(id(app))
+    assert not stats.heap_exceeded
+    assert 10 * 1024 <= stats.heap_retained < 64 * 1024
+    # The transient allocation in draw() on top of what update() kept
+    assert stats.heap_peak >= stats.heap_retained + 4 * 1024 - 1024
+    del elsewhere
+
+
+def test_heap_exceeded_by_what_the_app_keeps(tracing):
+    app = App(256 * 1024)
+    update = budget._budget_app_method(app, "update", app.update)
+    for _ in range(3):
+        update(0)
+    assert not budget._stats[id(app)].heap_exceeded
+    for _ in range(2):
+        update(0)
+    stats = budget._stats.pop(id(app))
+    assert stats.heap_exceeded
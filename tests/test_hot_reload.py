@@ -0,0 +1,152 @@
+import asyncio
+import builtins
+import sys
+import textwrap
+import types
+
+import pytest
+
+import badges
+import hot_reload
+
+MODULES = {
+    "base.py": """
+        X = 1
+    """,
+    "aaa.py": """
+        from base import X
+
+        class A:
+            x = X
+    """,
+    "zzz_b.py": """
+        from base import X
+        from aaa import A
+    """,
+}
+
+
+@pytest.fixture
+def firmware(tmp_path, monkeypatch):
+    for name, source in MODULES.items():
+        (tmp_path / name).write_text(textwrap.dedent(source))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def interpreter(firmware, monkeypatch):
+    monkeypatch.syspath_prepend(str(firmware))
+    monkeypatch.setattr(hot_reload._Interpreter, "imported_by", {})
+    monkeypatch.setattr(builtins, "__import__", builtins.__import__)
+    hot_reload.track_imports()
+    yield
+    for name in ("base", "aaa", "zzz_b"):
+        sys.modules.pop(name, None)
+
+
+def test_module_name():
+    assert hot_reload.module_name("app_components/tokens.py") == "app_components.tokens"
+    assert hot_reload.module_name("system/scheduler/__init__.py") == "system.scheduler"
+    assert hot_reload.module_name("apps/snake/app.py") == "apps.snake.app"
+    assert hot_reload.module_name("apps/snake/icon.png") is None
+
+
+def test_dependents_in_import_order(interpreter):
+    import zzz_b  # noqa: F401
+
+    space = hot_reload._Interpreter
+    assert hot_reload.dependents(space.modules, space.imported_by, "base") == ["base", "aaa", "zzz_b"]
+    assert hot_reload.dependents(space.modules, space.imported_by, "aaa") == ["aaa", "zzz_b"]
+    assert hot_reload.dependents(space.modules, space.imported_by, "zzz_b") == ["zzz_b"]
+
+
+def test_reloading_in_order_updates_imported_values(interpreter, firmware):
+    import zzz_b
+
+    (firmware / "base.py").write_text("X = 2\n")
+    space = hot_reload._Interpreter
+    for name in hot_reload.dependents(space.modules, space.imported_by, "base"):
+        space.reload(name)
+    assert zzz_b.X == 2
+    assert zzz_b.A.x == 2
+    assert zzz_b.A is sys.modules["aaa"].A
+
+
+def test_modules_that_hold_the_os_are_not_reloaded(firmware):
+    modules = {
+        name: types.ModuleType(name) for name in ("base", "main", "system.scheduler")
+    }
+    for module in modules.values():
+        module.__file__ = str(firmware / "module.py")
+    imported_by = {"base": {"main", "system.scheduler"}}
+    assert hot_reload.dependents(modules, imported_by, "base") == ["base"]
+
+
+def test_emulator_modules_are_not_reloaded(firmware):
+    modules = {name: types.ModuleType(name) for name in ("base", "vsync", "app_hooks")}
+    for name, module in modules.items():
+        module.__file__ = str(firmware / f"{name}.py")
+    imported_by = {"base": {"vsync", "app_hooks"}}
+    assert hot_reload.dependents(modules, imported_by, "base") == ["base"]
+
+
+def test_changes_to_emulator_modules_are_not_applied(firmware, monkeypatch):
+    import vsync
+
+    pipes = vsync._pipes
+    pipes.append(vsync.FramePipe())
+
+    class Response:
+        ok = True
+        status = 200
+
+        async def bytes(self):
+            return b"# changed\n"
+
+    async def pyfetch(url, **kwargs):
+        return Response()
+
+    http = types.ModuleType("pyodide.http")
+    http.pyfetch = pyfetch
+    monkeypatch.setitem(sys.modules, "pyodide", types.ModuleType("pyodide"))
+    monkeypatch.setitem(sys.modules, "pyodide.http", http)
+    monkeypatch.setattr(hot_reload._Interpreter, "path", staticmethod(lambda path: str(firmware / path)))
+
+    asyncio.run(hot_reload.apply({"source": "./vsync.py", "target": "vsync.py"}))
+    assert vsync._pipes is pipes
+    pipes.pop()
+
+
+def test_modules_outside_the_firmware_are_not_reloaded(firmware):
+    modules = {"base": types.ModuleType("base"), "json": types.ModuleType("json")}
+    modules["base"].__file__ = str(firmware / "base.py")
+    modules["json"].__file__ = "/usr/lib/python3/json/__init__.py"
+    assert hot_reload.dependents(modules, {"base": {"json"}}, "base") == ["base"]
+
+
+def test_badges_record_their_imports(firmware, tmp_path, monkeypatch):
+    monkeypatch.setattr(badges, "BADGES_ROOT", str(tmp_path / "badges"))
+    badge = badges.Badge(1, {}, badges.CodeCache(), str(firmware))
+    badge.import_module("zzz_b")
+    assert hot_reload.dependents(badge.modules, badge.imported_by, "base") == ["base", "aaa", "zzz_b"]
+
+
+def test_failed_fetches_are_not_written(firmware, monkeypatch):
+    class Response:
+        ok = False
+        status = 404
+
+        async def bytes(self):
+            return b"Not found"
+
+    async def pyfetch(url, **kwargs):
+        return Response()
+
+    http = types.ModuleType("pyodide.http")
+    http.pyfetch = pyfetch
+    monkeypatch.setitem(sys.modules, "pyodide", types.ModuleType("pyodide"))
+    monkeypatch.setitem(sys.modules, "pyodide.http", http)
+
+    asyncio.run(hot_reload.apply({"source": "./base.py", "target": "base.py"}))
+    assert "X = 1" in (firmware / "base.py").read_text()
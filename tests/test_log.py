@@ -0,0 +1,83 @@
+import pytest
+
+import log
+
+
+@pytest.fixture(autouse=True)
+def clean_log(monkeypatch):
+    written = []
+    monkeypatch.setattr(log, "level", log.INFO)
+    monkeypatch.setattr(log, "_source_levels", {})
+    monkeypatch.setattr(log, "_rates", {})
+    monkeypatch.setattr(log, "_overflowed", 0)
+    monkeypatch.setattr(log, "_buffer", log.collections.deque(maxlen=log.BUFFER_SIZE))
+    monkeypatch.setattr(log, "_write", lambda *lines: written.append(lines))
+    return written
+
+
+def flushed(written):
+    log.flush()
+    lines, warnings, errors = ([], [], [])
+    for batch in written:
+        lines += batch[0]
+        warnings += batch[1]
+        errors += batch[2]
+    return lines, warnings, errors
+
+
+def test_levels_filter_messages(clean_log):
+    log.debug("keys", "hidden")
+    log.info("keys", "shown")
+    log.set_level("debug", "keys")
+    log.debug("keys", "now shown")
+    log.debug("http", "still hidden")
+    lines, warnings, errors = flushed(clean_log)
+    assert lines == ["[keys] shown", "[keys] now shown"]
+
+
+def test_unknown_level_is_rejected():
+    with pytest.raises(ValueError, match="verbose"):
+        log.set_level("verbose")
+    assert log.level == log.INFO
+
+
+def test_errors_are_written_at_once(clean_log):
+    log.error("http", "failed")
+    assert clean_log == [([], [], ["[http] failed"])]
+
+
+def test_rate_limit_drops_and_reports(clean_log, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(log.time, "monotonic", lambda: now[0])
+    for n in range(log.RATE_LIMIT + 10):
+        log.info("leds", n)
+    now[0] += 1
+    log.info("leds", "next second")
+    lines, warnings, errors = flushed(clean_log)
+    assert len(lines) == log.RATE_LIMIT + 1
+    assert warnings == ["[leds] 10 messages dropped"]
+
+
+def test_drops_are_reported_when_a_source_goes_quiet(clean_log, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(log.time, "monotonic", lambda: now[0])
+    for n in range(log.RATE_LIMIT + 3):
+        log.info("leds", n)
+    lines, warnings, errors = flushed(clean_log)
+    assert warnings == []
+    now[0] += 1
+    clean_log.clear()
+    lines, warnings, errors = flushed(clean_log)
+    assert (lines, warnings) == ([], ["[leds] 3 messages dropped"])
+    clean_log.clear()
+    assert flushed(clean_log) == ([], [], [])
+
+
+def test_full_buffer_counts_what_it_drops(clean_log, monkeypatch):
+    monkeypatch.setattr(log, "RATE_LIMIT", 10 * log.BUFFER_SIZE)
+    for n in range(log.BUFFER_SIZE + 5):
+        log.info("display", n)
+    lines, warnings, errors = flushed(clean_log)
+    assert len(lines) == log.BUFFER_SIZE
+    assert lines[0] == "[display] 5"
+    assert warnings == [f"[log] 5 messages dropped, more than {log.BUFFER_SIZE} were logged in a frame"]
@@ -0,0 +1,90 @@
+import asyncio
+import errno
+
+import pytest
+
+import loopback
+
+
+@pytest.fixture
+def hub():
+    hub = loopback.Hub()
+    for index in range(3):
+        hub.endpoint(index).connect()
+    return hub
+
+
+def test_endpoints_have_addresses(hub):
+    assert [e.address for e in hub.endpoints] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert hub.endpoints[0].peers() == ["10.0.0.2", "10.0.0.3"]
+
+
+def test_datagrams_reach_only_the_address(hub):
+    one, two, three = hub.endpoints
+    a, b, c = one.socket(loopback.AF_INET, loopback.SOCK_DGRAM), two.socket(loopback.AF_INET, loopback.SOCK_DGRAM), three.socket(loopback.AF_INET, loopback.SOCK_DGRAM)
+    assert a.sendto(b"ping", ("10.0.0.2", 0)) == 4
+    assert b.recvfrom() == (b"ping", ("10.0.0.1", 0))
+    with pytest.raises(OSError) as e:
+        c.recvfrom()
+    assert e.value.errno == errno.EAGAIN
+
+
+def test_broadcast_reaches_every_other_connected_endpoint(hub):
+    one, two, three = hub.endpoints
+    a, b, c = one.socket(loopback.AF_INET, loopback.SOCK_DGRAM), two.socket(loopback.AF_INET, loopback.SOCK_DGRAM), three.socket(loopback.AF_INET, loopback.SOCK_DGRAM)
+    three.disconnect()
+    a.sendto(b"hello", (loopback.Hub.BROADCAST, 0))
+    assert b.recvfrom(3) == (b"hel", ("10.0.0.1", 0))
+    with pytest.raises(OSError):
+        a.recvfrom()
+    with pytest.raises(OSError):
+        c.recvfrom()
+
+
+def test_disconnected_endpoints_cant_send(hub):
+    one = hub.endpoints[0]
+    one.disconnect()
+    with pytest.raises(OSError) as e:
+        one.socket(loopback.AF_INET, loopback.SOCK_DGRAM).sendto(b"ping", ("10.0.0.2", 0))
+    assert e.value.errno == errno.ENETUNREACH
+
+
+def test_closed_sockets_receive_nothing(hub):
+    one, two, _ = hub.endpoints
+    b = two.socket(loopback.AF_INET, loopback.SOCK_DGRAM)
+    b.close()
+    one.socket(loopback.AF_INET, loopback.SOCK_DGRAM).sendto(b"ping", ("10.0.0.2", 0))
+    with pytest.raises(OSError):
+        b.recvfrom()
+
+
+def test_arecvfrom_waits_for_a_datagram(hub):
+    one, two, _ = hub.endpoints
+
+    async def exchange():
+        a, b = one.socket(loopback.AF_INET, loopback.SOCK_DGRAM), two.socket(loopback.AF_INET, loopback.SOCK_DGRAM)
+        received = asyncio.ensure_future(b.arecvfrom())
+        await asyncio.sleep(0)
+        assert not received.done()
+        a.sendto(b"ping", ("10.0.0.2", 0))
+        return await received
+
+    assert asyncio.run(exchange()) == (b"ping", ("10.0.0.1", 0))
+
+
+def test_socket_module(hub):
+    socket = hub.endpoints[0].socket_module()
+    other = hub.endpoints[1].socket_module("socket")
+    assert socket.__name__ == "usocket"
+    address = socket.getaddrinfo("10.0.0.2", 1234)[0][-1]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    r = other.socket(other.AF_INET, other.SOCK_DGRAM)
+    s.sendto(b"ping", address)
+    assert r.recvfrom() == (b"ping", ("10.0.0.1", 0))
+
+
+def test_only_datagram_sockets(hub):
+    socket = hub.endpoints[0].socket_module()
+    with pytest.raises(OSError) as e:
+        socket.socket()
+    assert e.value.errno == errno.EOPNOTSUPP
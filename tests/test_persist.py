@@ -0,0 +1,76 @@
+import builtins
+import os
+
+import pytest
+
+import persist
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    root = tmp_path / "persist"
+    root.mkdir()
+    monkeypatch.setattr(persist, "ROOT", str(root))
+    # Undo watch_writes() afterwards
+    monkeypatch.setattr(builtins, "open", builtins.open)
+    for name in persist.OS_WRITES:
+        monkeypatch.setattr(os, name, getattr(os, name))
+    persist.watch_writes()
+    persist._dirty.clear()
+    yield root
+    persist._dirty.clear()
+
+
+def test_reading_and_writing_elsewhere_is_clean(storage, tmp_path):
+    (storage / "stored.txt").write_bytes(b"stored")
+    persist._dirty.clear()
+    with open(storage / "stored.txt") as f:
+        f.read()
+    with open(tmp_path / "elsewhere.txt", "w") as f:
+        f.write("elsewhere")
+    os.mkdir(tmp_path / "elsewhere")
+    assert not persist._dirty.is_set()
+
+
+@pytest.mark.parametrize("mode", ["w", "ab", "r+"])
+def test_writing_a_stored_file_is_dirty(storage, mode):
+    (storage / "stored.txt").write_bytes(b"")
+    persist._dirty.clear()
+    with open(storage / "stored.txt", mode):
+        pass
+    assert persist._dirty.is_set()
+
+
+def test_writing_through_a_link_is_dirty(storage, tmp_path):
+    link = tmp_path / "apps"
+    persist.link(str(link), "apps")
+    persist._dirty.clear()
+    with open(str(link) + "/app.py", "w"):
+        pass
+    assert persist._dirty.is_set()
+
+
+def test_changing_stored_directories_is_dirty(storage, tmp_path):
+    os.mkdir(storage / "apps")
+    assert persist._dirty.is_set()
+    persist._dirty.clear()
+    os.rename(tmp_path / "persist" / "apps", storage / "moved")
+    assert persist._dirty.is_set()
+
+
+def test_link_file_keeps_a_file_in_storage(storage, tmp_path):
+    settings = tmp_path / "settings.json"
+    settings.write_text("{}")
+    target = persist.link_file(str(settings), "settings.json")
+    assert os.path.islink(settings)
+    assert open(target).read() == "{}"
+    persist._dirty.clear()
+    with open(settings, "w") as f:
+        f.write('{"name": "badge"}')
+    assert persist._dirty.is_set()
+    assert open(storage / "settings.json").read() == '{"name": "badge"}'
+
+    # Next load: the link is made again to what was stored
+    os.remove(settings)
+    persist.link_file(str(settings), "settings.json")
+    assert open(settings).read() == '{"name": "badge"}'
@@ -0,0 +1,30 @@
+import os
+
+import serve
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_watched_files_include_pyscript_files(monkeypatch):
+    monkeypatch.chdir(REPO)
+    files = serve.watched_files([])
+    # Reloading the emulator's own modules would lose their state
+    assert "./vsync.py" not in files and "./sys_display.py" not in files
+    assert files["./badge-2024-software/modules/app_components/tokens.py"] == "app_components/tokens.py"
+
+
+def test_watched_files_map_apps_under_apps(tmp_path, monkeypatch):
+    (tmp_path / "pyscript.toml").write_text(
+        '[files]\n"./badge-2024-software/modules/main.py" = "main.py"\n'
+        '"./vsync.py" = "vsync.py"\n\n[other]\n"./badge-2024-software/not.py" = "not.py"\n'
+    )
+    app = tmp_path / "my_app"
+    (app / "assets").mkdir(parents=True)
+    (app / "app.py").write_text("")
+    (app / "assets" / "icon.png").write_bytes(b"")
+    monkeypatch.chdir(tmp_path)
+    assert serve.watched_files(["my_app"]) == {
+        "./badge-2024-software/modules/main.py": "main.py",
+        "./my_app/app.py": "apps/my_app/app.py",
+        "./my_app/assets/icon.png": "apps/my_app/assets/icon.png",
+    }
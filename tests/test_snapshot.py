@@ -0,0 +1,71 @@
+import importlib
+import sys
+
+import pytest
+
+import persist
+import snapshot
+
+
+@pytest.fixture
+def firmware(tmp_path, monkeypatch):
+    root = tmp_path / "firmware"
+    (root / "system").mkdir(parents=True)
+    (root / "system" / "__init__.py").write_text("")
+    (root / "system" / "snapshot_firmware.py").write_text("VALUE = 1\n")
+    site = tmp_path / "site-packages"
+    (site / "package").mkdir(parents=True)
+    (site / "package" / "__init__.py").write_text("INSTALLED = True\n")
+
+    monkeypatch.setattr(persist, "ROOT", str(tmp_path / "persist"))
+    (tmp_path / "persist").mkdir()
+    monkeypatch.setattr(snapshot.sysconfig, "get_paths", lambda: {"purelib": str(site)})
+    monkeypatch.setattr(snapshot, "code", {})
+    monkeypatch.syspath_prepend(str(root))
+    monkeypatch.setattr(sys, "meta_path", list(sys.meta_path))
+    yield root
+    for name in ("system", "system.snapshot_firmware"):
+        sys.modules.pop(name, None)
+
+
+def test_firmware_hash_follows_the_source(firmware):
+    before = snapshot.firmware_hash(str(firmware))
+    assert snapshot.firmware_hash(str(firmware)) == before
+    (firmware / "apps").mkdir()
+    (firmware / "apps" / "app.py").write_text("")
+    assert snapshot.firmware_hash(str(firmware)) == before
+    (firmware / "system" / "snapshot_firmware.py").write_text("VALUE = 2\n")
+    assert snapshot.firmware_hash(str(firmware)) != before
+
+
+def test_restore_uses_the_stored_code(firmware, tmp_path):
+    importlib.import_module("system.snapshot_firmware")
+    assert snapshot.save(str(firmware)) > 0
+
+    site = tmp_path / "site-packages"
+    (site / "package" / "__init__.py").unlink()
+    assert snapshot.restore(str(firmware))
+    assert (site / "package" / "__init__.py").read_text() == "INSTALLED = True\n"
+    source = str(firmware / "system" / "snapshot_firmware.py")
+    assert source in snapshot.code
+
+    sys.modules.pop("system.snapshot_firmware")
+    spec = importlib.util.find_spec("system.snapshot_firmware")
+    assert isinstance(spec.loader, snapshot._CachedLoader)
+    assert importlib.import_module("system.snapshot_firmware").VALUE == 1
+
+
+def test_not_restored_after_the_firmware_changes(firmware):
+    importlib.import_module("system.snapshot_firmware")
+    snapshot.save(str(firmware))
+    (firmware / "system" / "snapshot_firmware.py").write_text("VALUE = 2\n")
+    assert not snapshot.restore(str(firmware))
+    assert snapshot.code == {}
+    assert snapshot._CachedCodeFinder not in sys.meta_path
+
+
+def test_clear(firmware):
+    snapshot.save(str(firmware))
+    snapshot.clear()
+    assert not snapshot.restore(str(firmware))
+    snapshot.clear()
@@ -0,0 +1,105 @@
+import asyncio
+import collections
+import json
+
+import pytest
+
+import app_hooks
+import tracing
+
+
+class LoopTask(asyncio.Task):
+    pass
+
+
+class Loop(asyncio.SelectorEventLoop):
+    # Makes tasks of its own kind, like Pyodide's WebLoop
+
+    def create_task(self, coro, **kwargs):
+        if self.get_task_factory() is None:
+            return LoopTask(coro, loop=self, **kwargs)
+        return super().create_task(coro, **kwargs)
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    monkeypatch.setattr(tracing, "_events", collections.deque(maxlen=tracing.MAX_EVENTS))
+    monkeypatch.setattr(tracing, "_metadata", [])
+    monkeypatch.setattr(tracing, "_tracks", {})
+    monkeypatch.setattr(tracing, "_enabled", False)
+    monkeypatch.setattr(tracing, "_next_tid", 1)
+    monkeypatch.setattr(asyncio, "sleep", asyncio.sleep)
+    monkeypatch.setattr(app_hooks, "wrappers", [])
+    loop = Loop()
+    tracing.enable(loop)
+    yield loop
+    loop.close()
+
+
+class App:
+    def update(self, delta):
+        pass
+
+    def draw(self, ctx):
+        pass
+
+
+def trace():
+    return json.loads(tracing.dumps())["traceEvents"]
+
+
+def test_tasks_are_made_by_the_loop(loop):
+    async def nothing():
+        pass
+
+    task = loop.create_task(nothing())
+    assert type(task) is LoopTask
+    loop.run_until_complete(task)
+    assert loop.get_task_factory() is not None
+
+
+def test_app_calls_are_nested_in_task_steps(loop):
+    app = app_hooks.wrap_app(App())
+
+    async def run_app():
+        app.update(10)
+        await asyncio.sleep(0.01)
+        app.draw(None)
+
+    loop.run_until_complete(run_app())
+    events = trace()
+
+    tracks = {e["args"]["name"]: e["tid"] for e in events if e["ph"] == "M"}
+    tid = tracks["test_app_calls_are_nested_in_task_steps.<locals>.run_app"]
+    assert tracks["event loop"] == 0
+
+    steps = [e for e in events if e["ph"] == "X" and e["cat"] == "task"]
+    calls = [e for e in events if e["ph"] == "X" and e["cat"] == "app"]
+    assert [c["name"] for c in calls] == ["App.update", "App.draw"]
+    for event in steps + calls:
+        assert event["pid"] == 1 and event["tid"] == tid
+        assert event["dur"] >= 0
+    for call in calls:
+        assert any(
+            step["ts"] <= call["ts"] and call["ts"] + call["dur"] <= step["ts"] + step["dur"]
+            for step in steps
+        )
+
+    begin, end = [e for e in events if e.get("cat") == "sleep"]
+    assert (begin["ph"], end["ph"]) == ("b", "e")
+    assert begin["id"] == end["id"] and begin["tid"] == tid
+    assert begin["args"]["delay_ms"] == 10
+    assert end["ts"] - begin["ts"] >= 10_000
+    assert end["args"]["late_us"] >= 0
+
+
+def test_tasks_with_the_same_name_share_a_track(loop):
+    async def handler():
+        await asyncio.sleep(0)
+
+    async def emit():
+        await asyncio.gather(*(handler() for _ in range(20)))
+
+    loop.run_until_complete(emit())
+    names = [e["args"]["name"] for e in trace() if e["ph"] == "M"]
+    assert len(names) == len(set(names)) == 3
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import vsync
+
+
+@pytest.fixture(autouse=True)
+def no_vsyncs(monkeypatch):
+    monkeypatch.setattr(vsync, "_vsyncs", vsync.collections.deque(maxlen=120))
+
+
+def test_pipe_fills_and_drains():
+    pipe = vsync.FramePipe(depth=2)
+    assert pipe.submit() and pipe.submit()
+    assert pipe.full()
+    assert not pipe.submit()
+    assert pipe.dropped == 1
+    pipe.vsync(time.perf_counter())
+    assert not pipe.full()
+    assert pipe.pending == 1
+
+
+def test_fps_is_the_nominal_rate_without_frames():
+    pipe = vsync.FramePipe()
+    assert pipe.fps() == vsync.VIRTUAL_RATE
+    pipe.submit()
+    pipe.vsync(time.perf_counter())
+    assert pipe.fps() == vsync.VIRTUAL_RATE
+
+
+def test_fps_measures_presented_frames():
+    pipe = vsync.FramePipe()
+    now = time.perf_counter()
+    for frame in range(31):
+        pipe.submit()
+        pipe.vsync(now - 0.5 + frame / 60)
+    assert pipe.fps() == pytest.approx(60)
+
+
+def test_rate_follows_vsyncs():
+    now = time.perf_counter()
+    vsync._vsyncs.extend(now + tick / 120 for tick in range(11))
+    assert vsync.rate() == pytest.approx(120)
+    assert vsync.FramePipe().fps() == pytest.approx(120)
@@ -0,0 +1,178 @@
+"""
+Timeline tracing of the asyncio event loop and the scheduler's app calls.
+
+Events are recorded in the Chrome trace event format, so the output of
+dumps() can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+Tasks are shown on a track for their coroutine's name, so the many short
+tasks of the same kind, like eventbus handlers, share one. Every step of a task (one resumption
+of its coroutine) is recorded as a slice, steps that hold the loop for
+longer than STALL_US are marked as stalls, sleeps are recorded as async
+slices along with how late they woke up, and the update()/draw() calls made
+by the scheduler show up nested inside the task step that made them.
+"""
+import asyncio
+import collections
+import collections.abc
+import json
+import time
+
+import app_hooks
+
+STALL_US = 50_000
+MAX_EVENTS = 500_000
+
+_events = collections.deque(maxlen=MAX_EVENTS)
+_metadata = []
+# Coroutine name -> its track
+_tracks = {}
+_enabled = False
+_next_tid = 1
+_current_tid = 0
+_next_sleep_id = 1
+_real_sleep = asyncio.sleep
+
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+
+def _emit(event):
+    event["pid"] = 1
+    _events.append(event)
+
+
+def _name_track(tid, name):
+    _metadata.append(
+        {"ph": "M", "pid": 1, "tid": tid, "name": "thread_name", "args": {"name": name}}
+    )
+
+
+def complete(name, cat, start_us, dur_us, tid=None, args=None):
+    if not _enabled:
+        return
+    event = {"ph": "X", "name": name, "cat": cat, "ts": start_us, "dur": dur_us,
+             "tid": _current_tid if tid is None else tid}
+    if args:
+        event["args"] = args
+    _emit(event)
+
+
+def instant(name, cat, tid=None, args=None):
+    if not _enabled:
+        return
+    event = {"ph": "i", "s": "t", "name": name, "cat": cat, "ts": _now_us(),
+             "tid": _current_tid if tid is None else tid}
+    if args:
+        event["args"] = args
+    _emit(event)
+
+
+class _TracedCoroutine(collections.abc.Coroutine):
+    # Wraps a task's coroutine so that every step the task takes is timed.
+
+    def __init__(self, coro, tid):
+        self._coro = coro
+        self._tid = tid
+        self._name = getattr(coro, "__qualname__", type(coro).__name__)
+
+    def _step(self, resume, *args):
+        global _current_tid
+        outer_tid = _current_tid
+        _current_tid = self._tid
+        start = _now_us()
+        try:
+            return resume(*args)
+        finally:
+            dur = _now_us() - start
+            complete(self._name, "task", start, dur, self._tid)
+            if dur > STALL_US:
+                instant("stall", "loop", self._tid, {"task": self._name, "dur_us": dur})
+            _current_tid = outer_tid
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+
+def _task_factory(previous):
+    def factory(loop, coro, **kwargs):
+        global _next_tid
+        if _enabled and asyncio.iscoroutine(coro):
+            name = getattr(coro, "__qualname__", type(coro).__name__)
+            tid = _tracks.get(name)
+            if tid is None:
+                tid = _tracks[name] = _next_tid
+                _next_tid += 1
+                _name_track(tid, name)
+            coro = _TracedCoroutine(coro, tid)
+            instant("create " + name, "task", args={"tid": tid})
+        if previous is not None:
+            return previous(loop, coro, **kwargs)
+        # Let the loop make the task, it may have its own kind, like
+        # Pyodide's PyodideTask
+        loop.set_task_factory(None)
+        try:
+            return loop.create_task(coro, **kwargs)
+        finally:
+            loop.set_task_factory(factory)
+
+    return factory
+
+
+async def _traced_sleep(delay, result=None):
+    global _next_sleep_id
+    sleep_id = _next_sleep_id
+    _next_sleep_id += 1
+    tid = _current_tid
+    start = _now_us()
+    _emit({"ph": "b", "name": "sleep", "cat": "sleep", "id": sleep_id, "ts": start,
+           "tid": tid, "args": {"delay_ms": delay * 1000}})
+    try:
+        return await _real_sleep(delay, result)
+    finally:
+        end = _now_us()
+        late = max(0, end - start - int(delay * 1_000_000))
+        _emit({"ph": "e", "name": "sleep", "cat": "sleep", "id": sleep_id, "ts": end,
+               "tid": tid, "args": {"late_us": late}})
+
+
+def _trace_app_method(app, name, method):
+    label = f"{type(app).__name__}.{name}"
+
+    def traced(*args, **kwargs):
+        start = _now_us()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            complete(label, "app", start, _now_us() - start)
+
+    return traced
+
+
+def enable(loop=None):
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    _name_track(0, "event loop")
+    loop.set_task_factory(_task_factory(loop.get_task_factory()))
+    asyncio.sleep = _traced_sleep
+    app_hooks.add_wrapper(_trace_app_method)
+
+
+def dumps():
+    return json.dumps(
+        {"traceEvents": _metadata + list(_events), "displayTimeUnit": "ms"}
+    )
+
@@ -0,0 +1,116 @@
+"""
+Frame pacing for the fake display.
+
+The badge's display has a short pipeline of frames waiting to be sent to
+the screen, and firmware can ask whether it is full before drawing another
+frame. FramePipe is that pipeline for a canvas: display.end_frame() puts a
+frame in, and each vsync takes one out. In the browser vsyncs come from
+requestAnimationFrame(), so the pipe drains at the rate the browser actually
+shows frames. Without a browser, an asyncio task stands in for it at
+VIRTUAL_RATE.
+
+Other work that should happen once per frame, rather than every time
+something changes, can be run with every_frame().
+"""
+import asyncio
+import collections
+import sys
+import time
+
+DEPTH = 2
+VIRTUAL_RATE = 60
+
+_pipes = []
+_callbacks = []
+_started = False
+# When the latest vsyncs happened, to measure the display's rate
+_vsyncs = collections.deque(maxlen=120)
+
+
+class FramePipe:
+    def __init__(self, depth=DEPTH):
+        self.depth = depth
+        self.pending = 0
+        self.dropped = 0
+        self._presented = collections.deque(maxlen=120)
+
+    def full(self):
+        return self.pending >= self.depth
+
+    def submit(self):
+        # Returns False if the frame was dropped because the pipe is full
+        if self.full():
+            self.dropped += 1
+            return False
+        self.pending += 1
+        return True
+
+    def vsync(self, now):
+        if self.pending:
+            self.pending -= 1
+            self._presented.append(now)
+
+    def fps(self, window=1.0):
+        # Until frames have been shown for a while, the display's own rate
+        now = time.perf_counter()
+        while self._presented and self._presented[0] < now - window:
+            self._presented.popleft()
+        if len(self._presented) < 2:
+            return rate()
+        return (len(self._presented) - 1) / (self._presented[-1] - self._presented[0])
+
+
+def rate():
+    # How many vsyncs a second there are, VIRTUAL_RATE until that's known
+    if len(_vsyncs) < 2 or _vsyncs[-1] == _vsyncs[0]:
+        return float(VIRTUAL_RATE)
+    return (len(_vsyncs) - 1) / (_vsyncs[-1] - _vsyncs[0])
+
+
+def _tick():
+    now = time.perf_counter()
+    _vsyncs.append(now)
+    for pipe in _pipes:
+        pipe.vsync(now)
+    for callback in _callbacks:
+        callback()
+
+
+def _start_animation_frames():
+    from js import window
+    from pyodide.ffi import create_proxy
+
+    def on_frame(timestamp):
+        _tick()
+        window.requestAnimationFrame(callback)
+
+    callback = create_proxy(on_frame)
+    window.requestAnimationFrame(callback)
+
+
+async def _virtual_vsync():
+    while True:
+        await asyncio.sleep(1 / VIRTUAL_RATE)
+        _tick()
+
+
+def start():
+    global _started
+    if _started:
+        return
+    _started = True
+    if sys.platform == "emscripten":
+        _start_animation_frames()
+    else:
+        asyncio.ensure_future(_virtual_vsync())
+
+
+def attach(pipe):
+    _pipes.append(pipe)
+    start()
+    return pipe
+
+
+def every_frame(callback):
+    _callbacks.append(callback)
+    start()